@@ -2,12 +2,13 @@
 API路由模块
 """
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from .document import router as document_router
 from .examination import router as examination_router
 from .ai import router as ai_router
 
 # 创建主路由
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # 注册子路由
 router.include_router(document_router, prefix="/documents", tags=["documents"])
@@ -2,13 +2,22 @@
 AI服务API
 """
 import json
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
+from typing import Any, AsyncIterator, Dict
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from ..services.ai_service import ai_service
+from ..services.ai_batcher import ai_batcher, QueueFullError
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# 支持的分析类型和意见类型
+_ANALYSIS_TYPES = frozenset({"comprehensive", "novelty", "inventiveness", "utility"})
+_ANALYSIS_TYPE_ERROR = "无效的分析类型。支持的类型: " + ", ".join(sorted(_ANALYSIS_TYPES))
+_OPINION_TYPES = frozenset({"notice", "grant", "rejection"})
+_OPINION_TYPE_ERROR = "无效的意见类型。支持的类型: " + ", ".join(sorted(_OPINION_TYPES))
 
 class AIAnalysisRequest(BaseModel):
     """AI分析请求模型"""
@@ -21,12 +30,12 @@ class OpinionGenerationRequest(BaseModel):
     opinion_type: str = "notice"
 
 @router.get("/status")
-async def get_ai_status():
+async def get_ai_status(request: Request):
     """
     获取AI服务状态
     """
     try:
-        availability = ai_service.check_model_availability()
+        availability = request.app.state.health.snapshot()
         
         return {
             "success": True,
@@ -53,17 +62,14 @@ async def analyze_text(request: AIAnalysisRequest):
     """
     AI文本分析
     """
+    # 验证分析类型
+    if request.analysis_type not in _ANALYSIS_TYPES:
+        raise HTTPException(status_code=400, detail=_ANALYSIS_TYPE_ERROR)
+    
     try:
-        # 验证分析类型
-        valid_types = ["comprehensive", "novelty", "inventiveness", "utility"]
-        if request.analysis_type not in valid_types:
-            raise HTTPException(
-                status_code=400,
-                detail=f"无效的分析类型。支持的类型: {', '.join(valid_types)}"
-            )
-        
         # 执行AI分析
-        ai_response = ai_service.analyze_patent_document(
+        ai_response = await ai_batcher.submit(
+            ai_service.aanalyze_patent_document,
             request.text,
             request.analysis_type
         )
@@ -76,33 +82,46 @@ async def analyze_text(request: AIAnalysisRequest):
                 "confidence": ai_response.confidence,
                 "processing_time": ai_response.processing_time,
                 "model_used": ai_response.model_used,
-                "analysis_type": request.analysis_type
+                "analysis_type": request.analysis_type,
+                "cached": ai_response.cached
             },
             "error_message": ai_response.error_message
         }
         
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="AI服务繁忙，请稍后重试")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"AI分析失败: {str(e)}"
         )
 
+@router.post("/analyze/stream")
+async def analyze_text_stream(request: AIAnalysisRequest):
+    """
+    AI文本分析（SSE流式输出）
+    """
+    if request.analysis_type not in _ANALYSIS_TYPES:
+        raise HTTPException(status_code=400, detail=_ANALYSIS_TYPE_ERROR)
+    
+    return StreamingResponse(
+        _sse_events(ai_service.stream_analyze(request.text, request.analysis_type)),
+        media_type="text/event-stream"
+    )
+
 @router.post("/generate-opinion")
 async def generate_opinion(request: OpinionGenerationRequest):
     """
     生成审查意见
     """
+    # 验证意见类型
+    if request.opinion_type not in _OPINION_TYPES:
+        raise HTTPException(status_code=400, detail=_OPINION_TYPE_ERROR)
+    
     try:
-        # 验证意见类型
-        valid_types = ["notice", "grant", "rejection"]
-        if request.opinion_type not in valid_types:
-            raise HTTPException(
-                status_code=400,
-                detail=f"无效的意见类型。支持的类型: {', '.join(valid_types)}"
-            )
-        
         # 生成审查意见
-        ai_response = ai_service.generate_examination_opinion(
+        ai_response = await ai_batcher.submit(
+            ai_service.agenerate_examination_opinion,
             request.analysis_result,
             request.opinion_type
         )
@@ -115,17 +134,33 @@ async def generate_opinion(request: OpinionGenerationRequest):
                 "confidence": ai_response.confidence,
                 "processing_time": ai_response.processing_time,
                 "model_used": ai_response.model_used,
-                "opinion_type": request.opinion_type
+                "opinion_type": request.opinion_type,
+                "cached": ai_response.cached
             },
             "error_message": ai_response.error_message
         }
         
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail="AI服务繁忙，请稍后重试")
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"审查意见生成失败: {str(e)}"
         )
 
+@router.post("/generate-opinion/stream")
+async def generate_opinion_stream(request: OpinionGenerationRequest):
+    """
+    生成审查意见（SSE流式输出）
+    """
+    if request.opinion_type not in _OPINION_TYPES:
+        raise HTTPException(status_code=400, detail=_OPINION_TYPE_ERROR)
+    
+    return StreamingResponse(
+        _sse_events(ai_service.stream_examination_opinion(request.analysis_result, request.opinion_type)),
+        media_type="text/event-stream"
+    )
+
 @router.post("/test-connection")
 async def test_ai_connection():
     """
@@ -135,7 +170,7 @@ async def test_ai_connection():
         # 使用简单文本测试连接
         test_text = "这是一个测试文本，用于验证AI服务连接。"
         
-        ai_response = ai_service.analyze_patent_document(
+        ai_response = await ai_service.aanalyze_patent_document(
             test_text,
             "comprehensive"
         )
@@ -147,6 +182,7 @@ async def test_ai_connection():
                 "connection_status": "connected" if ai_response.success else "failed",
                 "response_time": ai_response.processing_time,
                 "model_used": ai_response.model_used,
+                "cached": ai_response.cached,
                 "test_response": ai_response.content[:200] if ai_response.content else None  # 只返回前200字符
             },
             "error_message": ai_response.error_message
@@ -162,6 +198,11 @@ async def test_ai_connection():
             }
         }
 
+async def _sse_events(chunks: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """将输出片段编码为SSE事件"""
+    async for chunk in chunks:
+        yield f"data: {orjson.dumps(chunk).decode()}\n\n"
+
 def _get_status_recommendations(availability: Dict[str, bool]) -> Dict[str, str]:
     """获取状态建议"""
     recommendations = {}
@@ -3,23 +3,112 @@
 """
 import os
 import json
+import uuid
+import hashlib
 from pathlib import Path
-from typing import Dict, Any
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from typing import Dict, Any, List, Optional, Tuple
+import aiofiles
+import aiofiles.os
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from ..core.database import get_db, PatentApplication
+from ..core.database import (
+    get_db, SessionLocal, PatentApplication, UNRECOGNIZED,
+    STATUS_PARSING, STATUS_PENDING, STATUS_PARSE_FAILED
+)
 from ..services.document_parser import document_parser, PatentDocument
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# 上传文件分块读取大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+def load_patent_data(application: PatentApplication, db: Session) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    读取已保存的专利内容
+    
+    旧记录没有保存解析内容时，解析原文件并回填数据库。
+    
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any]]: 专利数据和解析元数据
+    
+    Raises:
+        HTTPException: 文档仍在解析（409）或解析失败（422）
+    """
+    if application.status == STATUS_PARSING:
+        raise HTTPException(status_code=409, detail="文档正在解析中，请稍后重试")
+    if application.status == STATUS_PARSE_FAILED:
+        error = application.get_parse_metadata().get("error")
+        raise HTTPException(status_code=422, detail=error or "文档解析失败")
+    
+    if not application.has_parsed_content:
+        if not application.file_path or not Path(application.file_path).exists():
+            raise HTTPException(status_code=404, detail="原始文件不存在")
+        
+        patent_doc, metadata = document_parser.parse_document(application.file_path)
+        application.store_parsed_content(patent_doc, metadata)
+        db.commit()
+    
+    return application.to_patent_data(), application.get_parse_metadata()
+
+def _parse_and_update(application_id: int, file_path: str, original_filename: str):
+    """
+    后台解析文档并更新申请记录
+    
+    在响应返回后由 BackgroundTasks 在线程池中执行，使用独立的数据库会话。
+    """
+    db = SessionLocal()
+    try:
+        try:
+            patent_doc, metadata = document_parser.parse_document(file_path)
+            metadata["original_filename"] = original_filename
+            
+            application = db.query(PatentApplication).filter(
+                PatentApplication.id == application_id
+            ).first()
+            if not application:
+                # 解析完成前记录已被删除
+                return
+            
+            application.application_number = patent_doc.application_number or UNRECOGNIZED
+            application.application_date = patent_doc.application_date or UNRECOGNIZED
+            application.title = patent_doc.title or UNRECOGNIZED
+            application.applicant = patent_doc.applicant or UNRECOGNIZED
+            application.inventor = patent_doc.inventor
+            application.store_parsed_content(patent_doc, metadata)
+            application.status = STATUS_PENDING
+            db.commit()
+            
+        except Exception as e:
+            db.rollback()
+            application = db.query(PatentApplication).filter(
+                PatentApplication.id == application_id
+            ).first()
+            if not application:
+                return
+            
+            application.status = STATUS_PARSE_FAILED
+            application.parse_metadata = json.dumps({
+                "original_filename": original_filename,
+                "error": str(e)
+            }, ensure_ascii=False)
+            db.commit()
+    finally:
+        db.close()
 
 @router.post("/upload")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
     """
-    上传并解析专利文档
+    上传专利文档
+    
+    文件写入后立即返回 status 为 parsing 的申请记录，解析在后台进行；
+    客户端轮询 /documents/{id} 直到状态变为 pending（解析完成）或 parse_failed。
     """
     # 检查文件格式
     allowed_extensions = ['.pdf', '.doc', '.docx', '.txt']
@@ -31,85 +120,156 @@ async def upload_document(
             detail=f"不支持的文件格式: {file_extension}。支持的格式: {', '.join(allowed_extensions)}"
         )
     
-    # 检查文件大小 (50MB限制)
+    # 分块写入临时文件，同时检查文件大小 (50MB限制) 并计算内容哈希
     max_size = 50 * 1024 * 1024  # 50MB
-    file_content = await file.read()
-    if len(file_content) > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"文件过大，最大支持50MB"
+    upload_dir = Path("data/uploads")
+    await aiofiles.os.makedirs(upload_dir, exist_ok=True)
+    
+    temp_path = upload_dir / f".{uuid.uuid4().hex}.part"
+    content_hash = hashlib.sha256()
+    total_size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total_size += len(chunk)
+                if total_size > max_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"文件过大，最大支持50MB"
+                    )
+                content_hash.update(chunk)
+                await f.write(chunk)
+    except Exception:
+        if await aiofiles.os.path.exists(temp_path):
+            await aiofiles.os.remove(temp_path)
+        raise
+    
+    file_hash = content_hash.hexdigest()
+    
+    # 相同内容已上传过，直接返回已有记录
+    existing = db.query(PatentApplication).filter(
+        PatentApplication.file_hash == file_hash
+    ).first()
+    if existing:
+        await aiofiles.os.remove(temp_path)
+        if existing.status == STATUS_PARSE_FAILED:
+            # 上次解析失败，重新解析
+            existing.status = STATUS_PARSING
+            db.commit()
+            background_tasks.add_task(
+                _parse_and_update, existing.id, existing.file_path, file.filename
+            )
+        elif existing.status != STATUS_PARSING:
+            load_patent_data(existing, db)
+        return _upload_response(
+            existing,
+            message="文档已存在，返回已有解析结果",
+            duplicate=True
         )
     
+    # 以内容哈希命名，避免同名文件互相覆盖
+    file_path = upload_dir / f"{file_hash}{file_extension}"
+    await aiofiles.os.replace(temp_path, file_path)
+    
     try:
-        # 保存文件
-        upload_dir = Path("data/uploads")
-        upload_dir.mkdir(exist_ok=True)
-        
-        file_path = upload_dir / file.filename
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        # 解析文档
-        patent_doc, metadata = document_parser.parse_document(str(file_path))
-        
-        # 验证文档
-        validation_result = document_parser.validate_document(patent_doc)
-        
-        # 保存到数据库
+        # 先保存待解析记录，解析完成后由后台任务更新
         db_application = PatentApplication(
-            application_number=patent_doc.application_number or "未识别",
-            application_date=patent_doc.application_date or "未识别",
-            title=patent_doc.title or "未识别",
-            applicant=patent_doc.applicant or "未识别",
-            inventor=patent_doc.inventor,
-            file_path=str(file_path)
+            application_date=UNRECOGNIZED,
+            title=UNRECOGNIZED,
+            applicant=UNRECOGNIZED,
+            status=STATUS_PARSING,
+            file_path=str(file_path),
+            file_hash=file_hash,
+            parse_metadata=json.dumps({"original_filename": file.filename}, ensure_ascii=False)
         )
-        
         db.add(db_application)
         db.commit()
         db.refresh(db_application)
         
-        return {
-            "success": True,
-            "message": "文档上传和解析成功",
-            "data": {
-                "application_id": db_application.id,
-                "patent_info": {
-                    "application_number": patent_doc.application_number,
-                    "application_date": patent_doc.application_date,
-                    "title": patent_doc.title,
-                    "applicant": patent_doc.applicant,
-                    "inventor": patent_doc.inventor,
-                    "technical_field": patent_doc.technical_field,
-                    "claims_count": len(patent_doc.claims) if patent_doc.claims else 0,
-                    "has_abstract": bool(patent_doc.abstract)
-                },
-                "metadata": metadata,
-                "validation": validation_result
-            }
-        }
-        
     except Exception as e:
-        # 清理上传的文件
-        if 'file_path' in locals() and file_path.exists():
-            file_path.unlink()
+        db.rollback()
+        # 清理上传的文件（并发上传相同内容时文件可能已被其他记录引用）
+        referenced = db.query(PatentApplication.id).filter(
+            PatentApplication.file_hash == file_hash
+        ).first()
+        if not referenced and await aiofiles.os.path.exists(file_path):
+            await aiofiles.os.remove(file_path)
         
         raise HTTPException(
             status_code=500,
             detail=f"文档处理失败: {str(e)}"
         )
+    
+    background_tasks.add_task(
+        _parse_and_update, db_application.id, str(file_path), file.filename
+    )
+    
+    return _upload_response(db_application, message="文档上传成功，正在解析")
+
+def _upload_response(
+    application: PatentApplication,
+    message: str,
+    duplicate: bool = False
+) -> Dict[str, Any]:
+    """构建上传接口响应，已解析的记录附带解析结果"""
+    data = {
+        "application_id": application.id,
+        "status": application.status,
+        "duplicate": duplicate
+    }
+    if application.has_parsed_content:
+        patent_data = application.to_patent_data()
+        data.update(_parsed_content_info(application, patent_data))
+        data["patent_info"] = {
+            "application_number": patent_data["application_number"],
+            "application_date": patent_data["application_date"],
+            "title": patent_data["title"],
+            "applicant": patent_data["applicant"],
+            "inventor": patent_data["inventor"],
+            "technical_field": patent_data["technical_field"],
+            "claims_count": len(patent_data["claims"]),
+            "has_abstract": bool(patent_data["abstract"])
+        }
+    
+    return {
+        "success": True,
+        "message": message,
+        "data": data
+    }
+
+def _parsed_content_info(application: PatentApplication, patent_data: Dict[str, Any]) -> Dict[str, Any]:
+    """解析元数据和验证结果"""
+    return {
+        "metadata": application.get_parse_metadata(),
+        "validation": document_parser.validate_document(PatentDocument.from_patent_data(patent_data))
+    }
 
 @router.get("/list")
 async def list_documents(
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[int] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db)
 ):
     """
-    获取文档列表
+    获取文档列表（按ID倒序）
+    
+    传入上一页返回的 next_cursor 时使用键集分页，避免深分页时 OFFSET 逐行跳过；
+    仅在 include_total=true 时统计总数。
     """
-    applications = db.query(PatentApplication).offset(skip).limit(limit).all()
-    total = db.query(PatentApplication).count()
+    query = db.query(PatentApplication).order_by(PatentApplication.id.desc())
+    if cursor is not None:
+        query = query.filter(PatentApplication.id < cursor)
+    else:
+        query = query.offset(skip)
+    applications = query.limit(limit).all()
+    
+    total = None
+    if include_total:
+        total = db.query(func.count(PatentApplication.id)).scalar()
+    
+    next_cursor = applications[-1].id if len(applications) == limit else None
     
     return {
         "success": True,
@@ -127,7 +287,8 @@ async def list_documents(
             ],
             "total": total,
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor
         }
     }
 
@@ -147,37 +308,47 @@ async def get_document_detail(
         raise HTTPException(status_code=404, detail="文档不存在")
     
     try:
-        # 重新解析文档获取完整信息
-        if application.file_path and Path(application.file_path).exists():
-            patent_doc, metadata = document_parser.parse_document(application.file_path)
-            
-            return {
-                "success": True,
-                "data": {
-                    "application_info": {
-                        "id": application.id,
-                        "application_number": application.application_number,
-                        "application_date": application.application_date,
-                        "title": application.title,
-                        "applicant": application.applicant,
-                        "inventor": application.inventor,
-                        "status": application.status,
-                        "created_at": application.created_at.isoformat() if application.created_at else None
-                    },
-                    "patent_content": {
-                        "technical_field": patent_doc.technical_field,
-                        "background_art": patent_doc.background_art,
-                        "invention_content": patent_doc.invention_content,
-                        "claims": patent_doc.claims,
-                        "description": patent_doc.description,
-                        "abstract": patent_doc.abstract
-                    },
-                    "metadata": metadata
-                }
-            }
+        patent_content = None
+        validation = None
+        if application.status in (STATUS_PARSING, STATUS_PARSE_FAILED):
+            # 尚未解析完成，仅返回状态供客户端轮询
+            metadata = application.get_parse_metadata()
         else:
-            raise HTTPException(status_code=404, detail="原始文件不存在")
-            
+            # 读取已保存的文档内容
+            patent_data, _ = load_patent_data(application, db)
+            parsed_info = _parsed_content_info(application, patent_data)
+            metadata = parsed_info["metadata"]
+            validation = parsed_info["validation"]
+            patent_content = {
+                "technical_field": patent_data["technical_field"],
+                "background_art": patent_data["background_art"],
+                "invention_content": patent_data["invention_content"],
+                "claims": patent_data["claims"],
+                "description": patent_data["description"],
+                "abstract": patent_data["abstract"]
+            }
+        
+        return {
+            "success": True,
+            "data": {
+                "application_info": {
+                    "id": application.id,
+                    "application_number": application.application_number,
+                    "application_date": application.application_date,
+                    "title": application.title,
+                    "applicant": application.applicant,
+                    "inventor": application.inventor,
+                    "status": application.status,
+                    "created_at": application.created_at.isoformat() if application.created_at else None
+                },
+                "patent_content": patent_content,
+                "metadata": metadata,
+                "validation": validation
+            }
+        }
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -201,8 +372,10 @@ async def delete_document(
     
     try:
         # 删除文件
-        if application.file_path and Path(application.file_path).exists():
-            Path(application.file_path).unlink()
+        if application.file_path and await aiofiles.os.path.exists(application.file_path):
+            await aiofiles.os.remove(application.file_path)
+        if application.file_path:
+            document_parser.invalidate(application.file_path)
         
         # 删除数据库记录
         db.delete(application)
@@ -1,18 +1,27 @@
 """
 审查功能API
 """
-import json
-from typing import Dict, Any, List, Optional
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
-from ..core.database import get_db, PatentApplication, ExaminationRecord
-from ..services.document_parser import document_parser
+from ..core.database import get_db, PatentApplication, ExaminationRecord, UNRECOGNIZED
 from ..services.rule_engine import rule_engine, RuleType
 from ..services.ai_service import ai_service
+from ..utils.prompt_trim import trim_sections
+from .document import load_patent_data
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# 历史列表中保留的规则摘要字段
+SUMMARY_FIELDS = ("total_rules", "passed", "failed", "warnings", "skipped", "overall_confidence", "overall_recommendation")
+
+# 新颖性风险评估时比对的已有申请数上限
+NOVELTY_REFERENCE_LIMIT = 200
 
 class ExaminationRequest(BaseModel):
     """审查请求模型"""
@@ -37,25 +46,8 @@ async def start_examination(
         raise HTTPException(status_code=404, detail="专利申请不存在")
     
     try:
-        # 解析文档获取完整数据
-        if not application.file_path:
-            raise HTTPException(status_code=400, detail="文档文件不存在")
-        
-        patent_doc, metadata = document_parser.parse_document(application.file_path)
-        
-        # 准备审查数据
-        patent_data = {
-            "application_number": patent_doc.application_number,
-            "title": patent_doc.title,
-            "applicant": patent_doc.applicant,
-            "inventor": patent_doc.inventor,
-            "technical_field": patent_doc.technical_field,
-            "background_art": patent_doc.background_art,
-            "invention_content": patent_doc.invention_content,
-            "claims": patent_doc.claims,
-            "description": patent_doc.description,
-            "abstract": patent_doc.abstract
-        }
+        # 读取已保存的文档内容
+        patent_data, _ = load_patent_data(application, db)
         
         # 确定要执行的规则类型
         rule_types_to_execute = None
@@ -67,8 +59,10 @@ async def start_examination(
             rule_types_to_execute = [RuleType.NOVELTY, RuleType.INVENTIVENESS, RuleType.UTILITY]
         # comprehensive 执行所有规则
         
-        # 执行规则检查
-        rule_results = rule_engine.execute_rules(patent_data, rule_types_to_execute)
+        # 在工作线程中执行规则检查，避免阻塞事件循环
+        rule_results = await asyncio.to_thread(
+            rule_engine.execute_rules, patent_data, rule_types_to_execute
+        )
         rule_summary = rule_engine.get_summary(rule_results)
         
         # 创建审查记录
@@ -77,12 +71,12 @@ async def start_examination(
             examination_type=request.examination_type,
             examination_step="rule_based_check",
             status="completed",
-            result=json.dumps({
+            result=orjson.dumps({
                 "rule_results": [
                     {
                         "rule_name": r.rule_name,
                         "rule_type": r.rule_type.value,
-                        "result": r.result.value,
+                        "result": r.result.label,
                         "confidence": r.confidence,
                         "message": r.message,
                         "details": r.details,
@@ -91,7 +85,10 @@ async def start_examination(
                     for r in rule_results
                 ],
                 "summary": rule_summary
-            }, ensure_ascii=False),
+            }).decode(),
+            result_summary=orjson.dumps({
+                field: rule_summary.get(field) for field in SUMMARY_FIELDS
+            }).decode(),
             confidence_score=str(rule_summary["overall_confidence"])
         )
         
@@ -109,7 +106,7 @@ async def start_examination(
                     {
                         "rule_name": r.rule_name,
                         "rule_type": r.rule_type.value,
-                        "result": r.result.value,
+                        "result": r.result.label,
                         "confidence": r.confidence,
                         "message": r.message,
                         "execution_time": r.execution_time
@@ -120,6 +117,8 @@ async def start_examination(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -129,6 +128,7 @@ async def start_examination(
 @router.post("/ai-analysis")
 async def ai_analysis(
     request: ExaminationRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
     """
@@ -143,26 +143,29 @@ async def ai_analysis(
         raise HTTPException(status_code=404, detail="专利申请不存在")
     
     try:
-        # 检查AI服务可用性
-        availability = ai_service.check_model_availability()
+        # AI服务可用性（由后台健康检查更新）
+        availability = http_request.app.state.health.snapshot()
         
-        # 解析文档
-        patent_doc, metadata = document_parser.parse_document(application.file_path)
+        # 读取已保存的文档内容
+        patent_data, _ = load_patent_data(application, db)
         
-        # 准备分析文本
-        analysis_text = ""
-        if patent_doc.title:
-            analysis_text += f"发明名称: {patent_doc.title}\n"
-        if patent_doc.technical_field:
-            analysis_text += f"技术领域: {patent_doc.technical_field}\n"
-        if patent_doc.invention_content:
-            analysis_text += f"发明内容: {patent_doc.invention_content}\n"
-        if patent_doc.claims:
-            analysis_text += f"权利要求: {' '.join(patent_doc.claims[:3])}\n"  # 只取前3项
+        # 准备分析文本，各段按token预算裁剪，控制提示词长度
+        sections = []
+        if patent_data["title"]:
+            sections.append(("发明名称", patent_data["title"]))
+        if patent_data["abstract"]:
+            sections.append(("摘要", patent_data["abstract"]))
+        if patent_data["technical_field"]:
+            sections.append(("技术领域", patent_data["technical_field"]))
+        if patent_data["invention_content"]:
+            sections.append(("发明内容", patent_data["invention_content"]))
+        if patent_data["claims"]:
+            sections.append(("权利要求", " ".join(patent_data["claims"][:3])))  # 只取前3项
+        analysis_text = "".join(f"{label}: {text}\n" for label, text in trim_sections(sections))
         
         # 执行AI分析
-        ai_response = ai_service.analyze_patent_document(
-            analysis_text, 
+        ai_response = await ai_service.aanalyze_patent_document(
+            analysis_text,
             request.examination_type
         )
         
@@ -172,7 +175,7 @@ async def ai_analysis(
             examination_type=f"ai_{request.examination_type}",
             examination_step="ai_analysis",
             status="completed" if ai_response.success else "failed",
-            result=json.dumps({
+            result=orjson.dumps({
                 "ai_analysis": {
                     "success": ai_response.success,
                     "content": ai_response.content,
@@ -182,7 +185,12 @@ async def ai_analysis(
                     "error_message": ai_response.error_message
                 },
                 "model_availability": availability
-            }, ensure_ascii=False),
+            }).decode(),
+            result_summary=orjson.dumps({
+                "success": ai_response.success,
+                "confidence": ai_response.confidence,
+                "model_used": ai_response.model_used
+            }).decode(),
             confidence_score=str(ai_response.confidence)
         )
         
@@ -206,12 +214,101 @@ async def ai_analysis(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"AI分析失败: {str(e)}"
         )
 
+@router.post("/novelty-risk")
+async def novelty_risk(
+    request: ExaminationRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    新颖性风险预评估
+    
+    与已有申请的嵌入向量做k近邻比对，不调用生成模型。
+    参考申请的向量按文件内容哈希缓存，每次请求只需嵌入待评估文档。
+    """
+    # 数据库读取和JSON解码在线程池中执行，避免阻塞事件循环
+    patent_text, references, reference_texts = await asyncio.to_thread(
+        _load_novelty_inputs, request.application_id, db
+    )
+    
+    try:
+        result = await ai_service.assess_novelty_risk(
+            patent_text,
+            reference_texts,
+            reference_keys=[reference.file_hash or f"application:{reference.id}" for reference in references]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"嵌入模型调用失败: {str(e)}")
+    
+    return {
+        "success": True,
+        "data": {
+            "application_id": request.application_id,
+            "risk_level": result["risk_level"],
+            "max_similarity": result["max_similarity"],
+            "similar_applications": [
+                {
+                    "application_id": references[neighbor["index"]].id,
+                    "title": references[neighbor["index"]].title,
+                    "similarity": neighbor["similarity"]
+                }
+                for neighbor in result["neighbors"]
+            ],
+            "reference_count": len(references)
+        }
+    }
+
+def _load_novelty_inputs(application_id: int, db: Session) -> Tuple[str, List[Any], List[str]]:
+    """
+    读取待评估文档和参考申请
+    
+    Returns:
+        Tuple: 待评估文本、参考申请行（id、title、file_hash）和参考文本
+    """
+    application = db.query(PatentApplication).filter(
+        PatentApplication.id == application_id
+    ).first()
+    
+    if not application:
+        raise HTTPException(status_code=404, detail="专利申请不存在")
+    
+    patent_data, _ = load_patent_data(application, db)
+    # 只读取比对需要的列
+    references = db.query(
+        PatentApplication.id,
+        PatentApplication.title,
+        PatentApplication.file_hash,
+        PatentApplication.abstract,
+        PatentApplication.claims_json
+    ).filter(
+        PatentApplication.id != application_id,
+        PatentApplication.claims_json.isnot(None)
+    ).order_by(PatentApplication.id.desc()).limit(NOVELTY_REFERENCE_LIMIT).all()
+    
+    reference_texts = [
+        _novelty_text({
+            "title": None if reference.title == UNRECOGNIZED else reference.title,
+            "abstract": reference.abstract,
+            "claims": orjson.loads(reference.claims_json)
+        })
+        for reference in references
+    ]
+    return _novelty_text(patent_data), references, reference_texts
+
+def _novelty_text(patent_data: Dict[str, Any]) -> str:
+    """新颖性比对使用的文本：发明名称、摘要和独立权利要求"""
+    parts = [patent_data["title"], patent_data["abstract"]]
+    if patent_data["claims"]:
+        parts.append(patent_data["claims"][0])
+    return "\n".join(part for part in parts if part)
+
 @router.get("/history/{application_id}")
 async def get_examination_history(
     application_id: int,
@@ -220,7 +317,16 @@ async def get_examination_history(
     """
     获取审查历史
     """
-    records = db.query(ExaminationRecord).filter(
+    # 只读取摘要列，完整结果通过 /examination/{examination_id} 获取
+    records = db.query(
+        ExaminationRecord.id,
+        ExaminationRecord.examination_type,
+        ExaminationRecord.examination_step,
+        ExaminationRecord.status,
+        ExaminationRecord.confidence_score,
+        ExaminationRecord.created_at,
+        ExaminationRecord.result_summary
+    ).filter(
         ExaminationRecord.application_id == application_id
     ).order_by(ExaminationRecord.created_at.desc()).all()
     
@@ -236,7 +342,7 @@ async def get_examination_history(
                     "status": record.status,
                     "confidence_score": record.confidence_score,
                     "created_at": record.created_at.isoformat() if record.created_at else None,
-                    "result_summary": json.loads(record.result) if record.result else None
+                    "result_summary": orjson.loads(record.result_summary) if record.result_summary else None
                 }
                 for record in records
             ]
@@ -265,11 +371,11 @@ async def get_examination_rules():
     }
 
 @router.get("/ai/status")
-async def get_ai_status():
+async def get_ai_status(request: Request):
     """
     获取AI服务状态
     """
-    availability = ai_service.check_model_availability()
+    availability = request.app.state.health.snapshot()
     
     return {
         "success": True,
@@ -281,4 +387,33 @@ async def get_ai_status():
                 "backup_model": "建议下载备用模型" if not availability["backup_model"] else "备用模型可用"
             }
         }
+    }
+
+@router.get("/{examination_id}")
+async def get_examination_record(
+    examination_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    获取审查记录完整结果
+    """
+    record = db.query(ExaminationRecord).filter(
+        ExaminationRecord.id == examination_id
+    ).first()
+    
+    if not record:
+        raise HTTPException(status_code=404, detail="审查记录不存在")
+    
+    return {
+        "success": True,
+        "data": {
+            "id": record.id,
+            "application_id": record.application_id,
+            "examination_type": record.examination_type,
+            "examination_step": record.examination_step,
+            "status": record.status,
+            "confidence_score": record.confidence_score,
+            "created_at": record.created_at.isoformat() if record.created_at else None,
+            "result": orjson.loads(record.result) if record.result else None
+        }
     }
\ No newline at end of file
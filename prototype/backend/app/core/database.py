@@ -1,24 +1,66 @@
 """
 数据库配置和初始化
 """
-import sqlite3
+import asyncio
+import json
+import os
 from pathlib import Path
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from typing import Any, Dict, Optional
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import create_engine, event, text, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
 
 # 数据库文件路径
 DB_PATH = Path(__file__).parent.parent.parent / "data" / "patent_examination.db"
 DB_PATH.parent.mkdir(exist_ok=True)
 
+# 请求等待启动时数据库初始化完成的最长时间（秒）
+DB_READY_TIMEOUT = float(os.getenv("DB_READY_TIMEOUT", "10"))
+
 # SQLAlchemy配置
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=20,
+    max_overflow=40
+)
+
+# SQLite连接参数：WAL模式下读写互不阻塞，synchronous=NORMAL 仅在检查点时同步磁盘
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",     # 64MB页缓存
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256MB内存映射
+    "PRAGMA busy_timeout=5000",
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """为每个新连接设置SQLite参数"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# 解析失败字段的占位值
+UNRECOGNIZED = "未识别"
+
+# 文档解析状态：上传后后台解析，完成后进入待审查状态
+STATUS_PARSING = "parsing"
+STATUS_PENDING = "pending"
+STATUS_PARSE_FAILED = "parse_failed"
+
 # 数据模型定义
 class PatentApplication(Base):
     """专利申请表"""
@@ -30,10 +72,57 @@ class PatentApplication(Base):
     title = Column(String(500))
     applicant = Column(String(500))
     inventor = Column(String(500))
-    status = Column(String(50), default="pending")
+    status = Column(String(50), default=STATUS_PENDING)
     file_path = Column(String(1000))
+    file_hash = Column(String(64), unique=True, index=True)  # 文件内容SHA-256，用于去重
+    # 解析后的文档内容，上传时写入，避免重复解析原文件
+    technical_field = Column(Text)
+    background_art = Column(Text)
+    invention_content = Column(Text)
+    claims_json = Column(Text)  # JSON格式存储权利要求列表
+    description = Column(Text)
+    abstract = Column(Text)
+    parse_metadata = Column(Text)  # JSON格式存储解析元数据
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def has_parsed_content(self) -> bool:
+        """是否已保存解析内容"""
+        return self.claims_json is not None
+    
+    def store_parsed_content(self, patent_doc: Any, metadata: Dict[str, Any]):
+        """保存文档解析结果"""
+        self.technical_field = patent_doc.technical_field
+        self.background_art = patent_doc.background_art
+        self.invention_content = patent_doc.invention_content
+        self.claims_json = json.dumps(patent_doc.formatted_claims, ensure_ascii=False)
+        self.description = patent_doc.description
+        self.abstract = patent_doc.abstract
+        self.parse_metadata = json.dumps(metadata, ensure_ascii=False)
+    
+    def to_patent_data(self) -> Dict[str, Any]:
+        """转换为规则引擎和AI分析使用的专利数据"""
+        def recognized(value: Optional[str]) -> Optional[str]:
+            return None if value == UNRECOGNIZED else value
+        
+        return {
+            "application_number": recognized(self.application_number),
+            "application_date": recognized(self.application_date),
+            "title": recognized(self.title),
+            "applicant": recognized(self.applicant),
+            "inventor": self.inventor,
+            "technical_field": self.technical_field,
+            "background_art": self.background_art,
+            "invention_content": self.invention_content,
+            "claims": json.loads(self.claims_json) if self.claims_json else [],
+            "description": self.description,
+            "abstract": self.abstract
+        }
+    
+    def get_parse_metadata(self) -> Dict[str, Any]:
+        """获取解析元数据"""
+        return json.loads(self.parse_metadata) if self.parse_metadata else {}
 
 class ExaminationRecord(Base):
     """审查记录表"""
@@ -45,8 +134,14 @@ class ExaminationRecord(Base):
     examination_step = Column(String(100))
     status = Column(String(50), default="pending")
     result = Column(Text)  # JSON格式存储结果
+    result_summary = Column(Text)  # JSON格式存储结果摘要（历史列表使用）
     confidence_score = Column(String(10))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        # 审查历史按申请ID过滤并按时间倒序
+        Index("ix_exam_app_created", "application_id", "created_at"),
+    )
 
 class ExaminationRule(Base):
     """审查规则表"""
@@ -60,9 +155,26 @@ class ExaminationRule(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+def _migrate_schema():
+    """为已有数据库补充新增的列（create_all 不会修改已存在的表）"""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {
+                row[1] for row in conn.execute(text(f"PRAGMA table_info({table.name})"))
+            }
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            # 新增列上的索引（含唯一约束）需单独创建
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
 def init_db():
     """初始化数据库"""
     Base.metadata.create_all(bind=engine)
+    _migrate_schema()
     
     # 插入默认规则
     db = SessionLocal()
@@ -97,8 +209,28 @@ def init_db():
     finally:
         db.close()
 
-def get_db() -> Session:
-    """获取数据库会话"""
+async def wait_db_ready(request: Request):
+    """
+    等待启动时的数据库初始化完成
+    
+    初始化完成前到达的请求最多等待 DB_READY_TIMEOUT 秒；超时或初始化失败时返回503。
+    """
+    state = request.app.state
+    ready: Optional[asyncio.Event] = getattr(state, "db_ready", None)
+    if ready is None or ready.is_set():
+        return
+    
+    init_task: Optional[asyncio.Task] = getattr(state, "db_init_task", None)
+    if init_task is not None:
+        # 不取消初始化任务，超时只影响本次请求
+        await asyncio.wait({init_task}, timeout=DB_READY_TIMEOUT)
+    if not ready.is_set():
+        error = getattr(state, "db_init_error", None)
+        detail = f"数据库初始化失败: {error}" if error else "数据库初始化中，请稍后重试"
+        raise HTTPException(status_code=503, detail=detail)
+
+def get_db(_: None = Depends(wait_db_ready)) -> Session:
+    """获取数据库会话（数据库就绪后）"""
     db = SessionLocal()
     try:
         yield db
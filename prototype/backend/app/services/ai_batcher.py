@@ -0,0 +1,148 @@
+"""
+AI请求批处理服务 - 合并短时间窗口内到达的请求，并发提交给Ollama
+"""
+import asyncio
+import os
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+# 单批最多合并的请求数
+MAX_BATCH = 8
+# 合并窗口（秒）
+BATCH_WINDOW = 0.02
+# 排队和执行中的请求总数上限，超过后拒绝请求（背压）
+MAX_QUEUE = 64
+# 与Ollama的 OLLAMA_NUM_PARALLEL 保持一致，限制同时在途的模型调用数
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+class QueueFullError(Exception):
+    """请求队列已满"""
+
+class AIBatcher:
+    """AI请求批处理器"""
+
+    def __init__(
+        self,
+        max_batch: int = MAX_BATCH,
+        batch_window: float = BATCH_WINDOW,
+        max_queue: int = MAX_QUEUE,
+        num_parallel: int = OLLAMA_NUM_PARALLEL
+    ):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.num_parallel = num_parallel
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._worker_task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._worker_task is not None and not self._worker_task.done()
+
+    def start(self):
+        """启动后台批处理任务（需在事件循环中调用）"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.num_parallel)
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """停止后台任务并取消未完成的请求"""
+        if self._worker_task is None:
+            return
+        self._worker_task.cancel()
+        try:
+            await self._worker_task
+        except asyncio.CancelledError:
+            pass
+        self._worker_task = None
+
+        for task in list(self._inflight):
+            task.cancel()
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    async def submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        提交一次模型调用
+
+        Args:
+            func: 异步调用函数（如 ai_service.aanalyze_patent_document），
+                  同步函数会在线程池中执行
+            *args: 调用参数
+
+        Returns:
+            调用结果
+
+        Raises:
+            QueueFullError: 排队和执行中的请求数超过上限
+        """
+        if not self.running:
+            # 未启动批处理时直接执行
+            return await self._call(func, args)
+
+        # 请求出队后即创建任务，在信号量处等待，需一并计入
+        if self._queue.qsize() + len(self._inflight) >= self.max_queue:
+            raise QueueFullError(f"AI请求队列已满（{self.max_queue}）")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((func, args, future))
+        return await future
+
+    async def _worker(self):
+        """收集窗口内的请求并批量分发"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[Callable[..., Any], tuple, asyncio.Future]]):
+        """并发执行一批请求，不阻塞下一批的收集"""
+        for func, args, future in batch:
+            task = asyncio.create_task(self._run(func, args, future))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, func: Callable[..., Any], args: tuple, future: asyncio.Future):
+        """在并发上限内执行单个请求"""
+        if future.done():
+            # 客户端已断开
+            return
+        async with self._semaphore:
+            try:
+                result = await self._call(func, args)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    @staticmethod
+    async def _call(func: Callable[..., Any], args: tuple) -> Any:
+        """执行调用，同步函数放入线程池"""
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.to_thread(func, *args)
+
+# 创建全局批处理实例
+ai_batcher = AIBatcher()
@@ -1,118 +1,63 @@
 """
 AI服务模块 - 集成本地AI模型
+
+异步接口通过共享的 httpx.AsyncClient 并发调用Ollama（见 analyze_batch）。
+Ollama 默认每个模型同时只处理少量请求，并发请求会在服务端排队；
+需要并行推理时启动服务前设置 OLLAMA_NUM_PARALLEL（如 4），
+显存占用随并行数近似线性增长。ai_batcher 读取同名环境变量限制在途请求数。
 """
+import asyncio
+import hashlib
 import json
+import httpx
+import numpy as np
+import os
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 import time
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from collections import OrderedDict
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Any
+from dataclasses import dataclass, field, replace
 from enum import Enum
 
-class AIModelType(Enum):
-    """AI模型类型"""
-    OLLAMA = "ollama"
-    OPENAI = "openai"
-    LOCAL = "local"
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.prompt_trim import truncate_to_tokens
 
-@dataclass
-class AIResponse:
-    """AI响应数据结构"""
-    success: bool
-    content: str
-    confidence: float
-    processing_time: float
-    model_used: str
-    error_message: Optional[str] = None
+# 新颖性风险评估的相似度阈值（嵌入向量余弦相似度）
+NOVELTY_HIGH_RISK_SIMILARITY = 0.9
+NOVELTY_MEDIUM_RISK_SIMILARITY = 0.8
+# 参考文本嵌入向量缓存条数（按参考文件内容哈希缓存，每份参考只嵌入一次）
+REFERENCE_EMBEDDING_CACHE_SIZE = 4096
 
-class AIService:
-    """AI服务类"""
-    
-    def __init__(self):
-        self.ollama_base_url = "http://localhost:11434"
-        self.default_model = "qwen2.5:7b"
-        self.backup_model = "llama2:7b"
-        self.timeout = 120  # 2分钟超时
-        
-    def check_model_availability(self) -> Dict[str, bool]:
-        """检查AI模型可用性"""
-        availability = {
-            "ollama_service": False,
-            "primary_model": False,
-            "backup_model": False
-        }
-        
-        try:
-            # 检查Ollama服务
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                availability["ollama_service"] = True
-                
-                # 检查模型是否已下载
-                models = response.json().get("models", [])
-                model_names = [model["name"] for model in models]
-                
-                availability["primary_model"] = self.default_model in model_names
-                availability["backup_model"] = self.backup_model in model_names
-                
-        except Exception as e:
-            print(f"检查模型可用性失败: {e}")
-            
-        return availability
-    
-    def analyze_patent_document(self, patent_text: str, analysis_type: str = "comprehensive") -> AIResponse:
-        """
-        分析专利文档
-        
-        Args:
-            patent_text: 专利文档文本
-            analysis_type: 分析类型 ('comprehensive', 'novelty', 'inventiveness', 'utility')
-            
-        Returns:
-            AIResponse: AI分析结果
-        """
-        start_time = time.time()
-        
-        # 构建提示词
-        prompt = self._build_analysis_prompt(patent_text, analysis_type)
-        
-        try:
-            # 尝试使用主模型
-            response = self._call_ollama_model(self.default_model, prompt)
-            if response.success:
-                response.processing_time = time.time() - start_time
-                return response
-            
-            # 主模型失败，尝试备用模型
-            print("主模型调用失败，尝试备用模型")
-            response = self._call_ollama_model(self.backup_model, prompt)
-            if response.success:
-                response.processing_time = time.time() - start_time
-                return response
-            
-            # 所有模型都失败，返回基于规则的分析
-            return self._fallback_analysis(patent_text, analysis_type, start_time)
-            
-        except Exception as e:
-            return AIResponse(
-                success=False,
-                content="",
-                confidence=0.0,
-                processing_time=time.time() - start_time,
-                model_used="none",
-                error_message=f"AI分析失败: {str(e)}"
-            )
-    
-    def _build_analysis_prompt(self, patent_text: str, analysis_type: str) -> str:
-        """构建分析提示词"""
-        base_prompt = """你是一名资深的实用新型专利审查员，请根据《专利法》《专利法实施细则》《专利审查指南》对以下专利申请进行分析。
+# 降级分析检测的关键词
+FALLBACK_KEYWORDS = ("发明", "实用新型", "技术方案", "权利要求", "技术效果")
+_FALLBACK_KEYWORD_MATCHER = KeywordMatcher(FALLBACK_KEYWORDS)
+
+# 降级链中各模型的读取超时（秒）：主模型超时后尽快切换到备用模型
+PRIMARY_TIMEOUT = float(os.getenv("OLLAMA_PRIMARY_TIMEOUT", "30"))
+BACKUP_TIMEOUT = float(os.getenv("OLLAMA_BACKUP_TIMEOUT", "60"))
+
+# 模型超时、限流（429）或服务端错误（5xx）后暂停调用的秒数
+PROVIDER_COOLDOWN = 60.0
+_TIMEOUT_MESSAGE = "请求超时"
+
+# 获取嵌入失败（如未安装嵌入模型）后跳过语义缓存的秒数
+EMBEDDING_RETRY_INTERVAL = 300.0
+
+# 流式读取模型输出的片段数上限，防止模型持续输出
+MAX_STREAM_CHUNKS = 4096
 
-专利申请内容：
-{patent_text}
+# 分析提示词中专利文本的token上限，控制预填充长度
+ANALYSIS_TOKEN_BUDGET = 2500
 
-请按照以下要求进行分析："""
+# 分析提示词。系统消息为固定字符串，专利文本作为单独的用户消息追加，
+# 不同请求的提示词前缀完全相同，Ollama 可复用已缓存的前缀KV
+ANALYSIS_SYSTEM_PROMPT = "你是一名资深的实用新型专利审查员，请根据《专利法》《专利法实施细则》《专利审查指南》对用户提供的专利申请进行分析。"
 
-        if analysis_type == "comprehensive":
-            specific_prompt = """
+ANALYSIS_SCHEMA_PROMPTS = {
+    "comprehensive": """请按照以下要求进行分析：
 1. 保护客体分析：判断是否属于实用新型保护范围
 2. 形式审查：检查文档完整性和格式规范性
 3. 新颖性初步评估：识别关键技术特征
@@ -128,10 +73,8 @@ class AIService:
     "utility": {"compliant": true/false, "reason": "原因"},
     "overall_recommendation": "总体建议",
     "confidence": 0.85
-}"""
-        elif analysis_type == "novelty":
-            specific_prompt = """
-专门进行新颖性分析：
+}""",
+    "novelty": """专门进行新颖性分析：
 1. 提取权利要求的技术特征
 2. 识别关键技术特征和区别特征
 3. 评估新颖性风险
@@ -144,10 +87,8 @@ class AIService:
     "novelty_risk": "high/medium/low",
     "search_suggestions": ["检索建议"],
     "confidence": 0.80
-}"""
-        elif analysis_type == "inventiveness":
-            specific_prompt = """
-专门进行创造性分析：
+}""",
+    "inventiveness": """专门进行创造性分析：
 1. 识别技术问题和技术效果
 2. 分析技术方案的创新性
 3. 评估显而易见性
@@ -161,10 +102,8 @@ class AIService:
     "obviousness_risk": "high/medium/low",
     "recommendation": "建议",
     "confidence": 0.75
-}"""
-        else:  # utility
-            specific_prompt = """
-专门进行实用性分析：
+}""",
+    "utility": """专门进行实用性分析：
 1. 检查技术方案完整性
 2. 评估可制造性和可实施性
 3. 分析技术效果的真实性
@@ -179,71 +118,874 @@ class AIService:
     "overall_utility": true/false,
     "confidence": 0.90
 }"""
-        
-        return base_prompt.format(patent_text=patent_text[:4000]) + specific_prompt  # 限制文本长度
+}
+
+OPINION_SYSTEM_PROMPT = """基于用户提供的分析结果，生成标准的专利审查意见书，要求：
+1. 严格按照国家知识产权局的格式
+2. 引用准确的法律条款
+3. 逻辑清晰，理由充分
+4. 语言专业、客观"""
+
+OPINION_SCHEMA_TEMPLATE = """请生成{opinion_type}类型的审查意见，以JSON格式输出：
+{{
+    "opinion_type": "{opinion_type}",
+    "main_content": "审查意见正文",
+    "legal_basis": ["法律依据"],
+    "recommendations": ["修改建议"],
+    "deadline": "答复期限",
+    "confidence": 0.80
+}}"""
+
+OPINION_SCHEMA_PROMPTS = {
+    opinion_type: OPINION_SCHEMA_TEMPLATE.format(opinion_type=opinion_type)
+    for opinion_type in ("notice", "grant", "rejection")
+}
+
+# Ollama /api/chat 消息列表
+Messages = List[Dict[str, str]]
+
+class AIModelType(Enum):
+    """AI模型类型"""
+    OLLAMA = "ollama"
+    OPENAI = "openai"
+    LOCAL = "local"
+
+@dataclass(slots=True)
+class AIResponse:
+    """AI响应数据结构"""
+    success: bool
+    content: str
+    confidence: float
+    processing_time: float
+    model_used: str
+    error_message: Optional[str] = None
+    cached: bool = False
+    status_code: Optional[int] = None  # 模型调用失败时的HTTP状态码
+    attempts: List[Tuple[str, str]] = field(default_factory=list)  # 降级链中失败的 (模型, 错误信息)
     
-    def _call_ollama_model(self, model_name: str, prompt: str) -> AIResponse:
-        """调用Ollama模型"""
-        try:
-            payload = {
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,  # 降低随机性，提高一致性
-                    "top_p": 0.9,
-                    "max_tokens": 2000
+    def drop_content(self) -> "AIResponse":
+        """返回不含正文的副本，批量保存结果时只需状态和置信度"""
+        return replace(self, content="")
+
+@dataclass
+class Provider:
+    """降级链中的模型提供方"""
+    name: str
+    call: Callable[[Messages], Awaitable[AIResponse]]
+    timeout: float
+
+@dataclass
+class AvailabilityState:
+    """模型可用性状态，由后台健康检查任务定期更新，路由直接读取"""
+    ollama_service: bool = False
+    primary_model: bool = False
+    backup_model: bool = False
+    checked_at: Optional[float] = None  # 最近一次检查的 time.monotonic()
+    
+    def update(self, availability: Dict[str, bool]):
+        """写入一次检查结果"""
+        self.ollama_service = availability["ollama_service"]
+        self.primary_model = availability["primary_model"]
+        self.backup_model = availability["backup_model"]
+        self.checked_at = time.monotonic()
+    
+    def age(self) -> float:
+        """距最近一次检查的秒数，从未检查时为无穷大"""
+        if self.checked_at is None:
+            return float("inf")
+        return time.monotonic() - self.checked_at
+    
+    def snapshot(self) -> Dict[str, bool]:
+        """当前可用性（不访问Ollama）"""
+        return {
+            "ollama_service": self.ollama_service,
+            "primary_model": self.primary_model,
+            "backup_model": self.backup_model
+        }
+
+class ResponseCache:
+    """AI响应缓存（LRU + TTL，线程安全）"""
+    
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """根据模型、类型和文本生成内容寻址键"""
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[AIResponse]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return response
+    
+    def set(self, key: str, response: AIResponse):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, response)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class SemanticCache:
+    """
+    语义缓存（线程安全）
+    
+    按嵌入向量的余弦相似度查找近似文本的响应，作为 ResponseCache 精确匹配之后的第二级缓存。
+    每个命名空间（模型+分析类型）一个环形向量矩阵，查询时整体做一次矩阵乘法。
+    """
+    
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.97, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._spaces: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, namespace: str, embedding: List[float]) -> Optional[AIResponse]:
+        """返回相似度不低于阈值的最近邻响应"""
+        query = self._normalize(embedding)
+        with self._lock:
+            space = self._spaces.get(namespace)
+            if space is None or space["vectors"].shape[1] != query.shape[0]:
+                return None
+            
+            size = len(space["responses"])
+            scores = space["vectors"][:size] @ query
+            scores[space["expires_at"][:size] < time.monotonic()] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            return space["responses"][best]
+    
+    def set(self, namespace: str, embedding: List[float], response: AIResponse):
+        vector = self._normalize(embedding)
+        with self._lock:
+            space = self._spaces.get(namespace)
+            if space is None or space["vectors"].shape[1] != vector.shape[0]:
+                # 首次写入或嵌入模型维度变化时重建
+                space = {
+                    "vectors": np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32),
+                    "expires_at": np.zeros(self.maxsize),
+                    "responses": [],
+                    "next": 0
                 }
-            }
+                self._spaces[namespace] = space
             
-            response = requests.post(
-                f"{self.ollama_base_url}/api/generate",
-                json=payload,
-                timeout=self.timeout
+            index = space["next"]
+            space["vectors"][index] = vector
+            space["expires_at"][index] = time.monotonic() + self.ttl
+            if index < len(space["responses"]):
+                space["responses"][index] = response
+            else:
+                space["responses"].append(response)
+            space["next"] = (index + 1) % self.maxsize
+    
+    def clear(self):
+        with self._lock:
+            self._spaces.clear()
+
+class _ChatStreamCollector:
+    """
+    拼接Ollama流式对话输出
+    
+    模型常在JSON之后追加说明文字；一旦第一个顶层JSON对象的括号闭合即停止读取，
+    不再等待其余输出。输出不含JSON时读到结束为止，结果与非流式调用相同。
+    """
+    
+    def __init__(self):
+        self.parts: List[str] = []
+        self.chunks = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+    
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+    
+    def feed_line(self, line: Any) -> bool:
+        """
+        处理一行NDJSON输出
+        
+        Returns:
+            bool: 是否已读取完毕
+        """
+        if not line:
+            return False
+        chunk = json.loads(line)
+        text = chunk.get("message", {}).get("content", "")
+        self.chunks += 1
+        
+        end = self._scan(text)
+        if end >= 0:
+            self.parts.append(text[:end])
+            return True
+        self.parts.append(text)
+        return chunk.get("done", False) or self.chunks >= MAX_STREAM_CHUNKS
+    
+    def _scan(self, text: str) -> int:
+        """跟踪括号深度（忽略字符串内的括号），返回顶层对象闭合后的位置，未闭合时返回-1"""
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._started:
+                    self._in_string = True
+            elif ch == "{":
+                self._started = True
+                self._depth += 1
+            elif ch == "}" and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    return i + 1
+        return -1
+
+class AIService:
+    """AI服务类"""
+    
+    def __init__(self):
+        self.ollama_base_url = "http://localhost:11434"
+        self.default_model = "qwen2.5:7b"
+        self.backup_model = "llama2:7b"
+        self.timeout = 120  # 2分钟超时
+        # 分析降级链中主模型和备用模型各自的超时
+        self.primary_timeout = PRIMARY_TIMEOUT
+        self.backup_timeout = BACKUP_TIMEOUT
+        # 降级链中暂时跳过的模型：名称 -> 恢复调用的 time.monotonic()
+        self._provider_health: Dict[str, float] = {}
+        self.response_cache = ResponseCache(maxsize=10000, ttl=3600)
+        # 语义缓存：近似重复的专利文本复用已有分析结果
+        self.embedding_model = "mxbai-embed-large"
+        self.semantic_cache = SemanticCache(maxsize=1024, threshold=0.97)
+        self.semantic_hit_penalty = 0.95  # 近似命中时置信度折减
+        # 嵌入失败后暂停语义缓存，到此 time.monotonic() 前不再请求 /api/embed
+        self._embedding_retry_at = 0.0
+        # 新颖性比对的参考向量（已归一化）：(嵌入模型, 参考键) -> 向量
+        self._reference_embeddings: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._reference_embeddings_lock = threading.Lock()
+        # 模型可用性状态，由后台任务每 health_interval 秒刷新，避免每次状态查询都访问Ollama
+        self.health = AvailabilityState()
+        self.health_interval = 5.0
+        self.availability_ttl = 30.0  # 模型很少变化，同步检查结果缓存30秒
+        self._availability_lock = threading.Lock()
+        # 同步HTTP会话，连接池复用到Ollama的TCP连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate"
+        })
+        # 异步HTTP客户端，由应用启动时创建并复用连接
+        self.aclient: Optional[httpx.AsyncClient] = None
+        # 各分析/意见类型固定的系统消息，构建请求时查表后只追加用户消息
+        self._analysis_system_messages = {
+            analysis_type: self._system_messages(ANALYSIS_SYSTEM_PROMPT, schema)
+            for analysis_type, schema in ANALYSIS_SCHEMA_PROMPTS.items()
+        }
+        self._opinion_system_messages = {
+            opinion_type: self._system_messages(OPINION_SYSTEM_PROMPT, schema)
+            for opinion_type, schema in OPINION_SCHEMA_PROMPTS.items()
+        }
+    
+    def open_async_client(self) -> httpx.AsyncClient:
+        """创建复用连接的异步HTTP客户端（HTTP/2 + keep-alive）"""
+        if self.aclient is None:
+            self.aclient = httpx.AsyncClient(
+                base_url=self.ollama_base_url,
+                http2=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=40,
+                    max_connections=100,
+                    keepalive_expiry=30.0
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0)
             )
+        return self.aclient
+    
+    async def aclose(self):
+        """关闭异步HTTP客户端"""
+        if self.aclient is not None:
+            await self.aclient.aclose()
+            self.aclient = None
+    
+    def close(self):
+        """关闭同步HTTP会话"""
+        self.session.close()
+        
+    def check_model_availability(self, force_refresh: bool = False) -> Dict[str, bool]:
+        """
+        检查AI模型可用性
+        
+        Args:
+            force_refresh: 忽略缓存，重新访问Ollama
+            
+        Returns:
+            Dict[str, bool]: 服务和模型的可用状态
+        """
+        if not force_refresh:
+            cached = self._get_cached_availability()
+            if cached is not None:
+                return cached
+        
+        with self._availability_lock:
+            # 等待锁期间可能已被其他线程刷新
+            if not force_refresh:
+                cached = self._get_cached_availability()
+                if cached is not None:
+                    return cached
             
+            availability = self._probe_model_availability()
+            self.health.update(availability)
+        
+        return dict(availability)
+    
+    def invalidate_availability(self):
+        """使可用性缓存失效（如下载新模型后），下次检查重新访问Ollama"""
+        self.health.checked_at = None
+    
+    async def async_check_model_availability(self) -> Dict[str, bool]:
+        """
+        异步检查AI模型可用性并更新 health
+        
+        Returns:
+            Dict[str, bool]: 服务和模型的可用状态
+        """
+        if self.aclient is None:
+            availability = await asyncio.to_thread(self._probe_model_availability)
+        else:
+            availability = self._unavailable()
+            try:
+                response = await self.aclient.get("/api/tags", timeout=5)
+                if response.status_code == 200:
+                    availability = self._availability_from_tags(response.json())
+            except Exception as e:
+                print(f"检查模型可用性失败: {e}")
+        
+        self.health.update(availability)
+        return availability
+    
+    async def health_loop(self):
+        """后台健康检查：定期访问Ollama并更新 health，探测频率与请求量无关"""
+        while True:
+            await self.async_check_model_availability()
+            await asyncio.sleep(self.health_interval)
+    
+    def _get_cached_availability(self) -> Optional[Dict[str, bool]]:
+        """返回未过期的可用性缓存"""
+        if self.health.age() >= self.availability_ttl:
+            return None
+        return self.health.snapshot()
+    
+    def _probe_model_availability(self) -> Dict[str, bool]:
+        """访问Ollama检查服务和模型状态"""
+        availability = self._unavailable()
+        
+        try:
+            # 检查Ollama服务
+            response = self.session.get(f"{self.ollama_base_url}/api/tags", timeout=5)
             if response.status_code == 200:
-                result = response.json()
-                content = result.get("response", "")
-                
-                # 尝试解析JSON响应
-                confidence = self._extract_confidence(content)
+                availability = self._availability_from_tags(response.json())
                 
-                return AIResponse(
-                    success=True,
-                    content=content,
-                    confidence=confidence,
-                    processing_time=0,  # 将在调用处设置
-                    model_used=model_name
-                )
-            else:
-                return AIResponse(
-                    success=False,
-                    content="",
-                    confidence=0.0,
-                    processing_time=0,
-                    model_used=model_name,
-                    error_message=f"HTTP {response.status_code}: {response.text}"
-                )
-                
-        except requests.exceptions.Timeout:
-            return AIResponse(
-                success=False,
-                content="",
-                confidence=0.0,
-                processing_time=0,
-                model_used=model_name,
-                error_message="请求超时"
-            )
+        except Exception as e:
+            print(f"检查模型可用性失败: {e}")
+            
+        return availability
+    
+    @staticmethod
+    def _unavailable() -> Dict[str, bool]:
+        """服务不可用时的状态"""
+        return {
+            "ollama_service": False,
+            "primary_model": False,
+            "backup_model": False
+        }
+    
+    def _availability_from_tags(self, tags: Dict[str, Any]) -> Dict[str, bool]:
+        """根据 /api/tags 响应检查模型是否已下载"""
+        model_names = [model["name"] for model in tags.get("models", [])]
+        
+        return {
+            "ollama_service": True,
+            "primary_model": self.default_model in model_names,
+            "backup_model": self.backup_model in model_names
+        }
+    
+    async def aanalyze_patent_document(self, patent_text: str, analysis_type: str = "comprehensive") -> AIResponse:
+        """
+        分析专利文档（通过共享的异步客户端调用Ollama）
+        
+        Args:
+            patent_text: 专利文档文本
+            analysis_type: 分析类型 ('comprehensive', 'novelty', 'inventiveness', 'utility')
+            
+        Returns:
+            AIResponse: AI分析结果
+        """
+        start_time = time.time()
+        
+        # 相同输入直接返回缓存结果
+        cache_key = ResponseCache.make_key(self.default_model, analysis_type, patent_text)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            return cached
+        
+        # 近似文本命中语义缓存
+        namespace = f"{self.default_model}|{analysis_type}"
+        embedding = await self._embed_text(patent_text)
+        cached = self._get_semantic_cached(namespace, embedding, start_time)
+        if cached:
+            return cached
+        
+        # 构建对话消息
+        messages = self._build_analysis_messages(patent_text, analysis_type)
+        
+        try:
+            # 依次尝试主模型、备用模型
+            response, attempts = await self._run_provider_chain(self._analysis_providers(), messages)
+            if response is not None:
+                response.processing_time = time.time() - start_time
+                self._cache_response(cache_key, namespace, embedding, response)
+                return response
+            
+            # 所有模型都失败，返回基于规则的分析
+            response = self._fallback_analysis(patent_text, analysis_type, start_time)
+            response.attempts = attempts
+            return response
+            
         except Exception as e:
             return AIResponse(
                 success=False,
                 content="",
                 confidence=0.0,
-                processing_time=0,
-                model_used=model_name,
-                error_message=str(e)
+                processing_time=time.time() - start_time,
+                model_used="none",
+                error_message=f"AI分析失败: {str(e)}"
+            )
+    
+    def _analysis_providers(self) -> List[Provider]:
+        """分析降级链：主模型、备用模型，各自使用较短的超时以便快速切换"""
+        return [
+            Provider(
+                name=model_name,
+                call=partial(self._call_ollama_model, model_name, timeout=timeout),
+                timeout=timeout
+            )
+            for model_name, timeout in (
+                (self.default_model, self.primary_timeout),
+                (self.backup_model, self.backup_timeout)
             )
+        ]
+    
+    async def _run_provider_chain(
+        self,
+        chain: List[Provider],
+        messages: Messages
+    ) -> Tuple[Optional[AIResponse], List[Tuple[str, str]]]:
+        """
+        依次调用降级链中的模型，跳过暂不可用的模型
+        
+        Returns:
+            Tuple: 首个成功的响应（全部失败时为None）和失败记录
+        """
+        trace: List[Tuple[str, str]] = []
+        for provider in chain:
+            if self._unhealthy(provider):
+                trace.append((provider.name, "暂不可用，已跳过"))
+                continue
+            response = await provider.call(messages)
+            if response.success:
+                response.attempts = trace
+                return response, trace
+            self._record_failure(provider, response, trace)
+        return None, trace
+    
+    def _unhealthy(self, provider: Provider) -> bool:
+        """模型是否处于失败后的暂停期"""
+        until = self._provider_health.get(provider.name)
+        return until is not None and time.monotonic() < until
+    
+    def _record_failure(self, provider: Provider, response: AIResponse, trace: List[Tuple[str, str]]):
+        """记录失败；超时、限流或服务端错误时暂停调用该模型"""
+        print(f"模型 {provider.name} 调用失败: {response.error_message}")
+        trace.append((provider.name, response.error_message or ""))
+        status_code = response.status_code or 0
+        if response.error_message == _TIMEOUT_MESSAGE or status_code == 429 or status_code >= 500:
+            self._provider_health[provider.name] = time.monotonic() + PROVIDER_COOLDOWN
+    
+    async def analyze_batch(self, texts: List[str], analysis_type: str = "comprehensive") -> List[AIResponse]:
+        """
+        并发分析多份专利文本
+        
+        各请求同时发给Ollama，总耗时接近单次调用耗时（受 OLLAMA_NUM_PARALLEL 限制）。
+        
+        Args:
+            texts: 专利文档文本列表
+            analysis_type: 分析类型
+            
+        Returns:
+            List[AIResponse]: 与 texts 顺序一致的分析结果
+        """
+        results = await asyncio.gather(
+            *(self.aanalyze_patent_document(text, analysis_type) for text in texts),
+            return_exceptions=True
+        )
+        
+        return [
+            self._error_response("none", f"AI分析失败: {str(result)}")
+            if isinstance(result, Exception) else result
+            for result in results
+        ]
+    
+    def stream_analyze(self, patent_text: str, analysis_type: str = "comprehensive") -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式分析专利文档，逐段返回模型输出
+        
+        Args:
+            patent_text: 专利文档文本
+            analysis_type: 分析类型 ('comprehensive', 'novelty', 'inventiveness', 'utility')
+            
+        Returns:
+            AsyncIterator[Dict[str, Any]]: 输出片段 {"model", "content", "done"}
+        """
+        start_time = time.time()
+        return self._stream_with_fallback(
+            self._build_analysis_messages(patent_text, analysis_type),
+            (self.default_model, self.backup_model),
+            lambda: self._fallback_analysis(patent_text, analysis_type, start_time)
+        )
+    
+    def stream_examination_opinion(self, analysis_result: str, opinion_type: str = "notice") -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成审查意见
+        
+        Args:
+            analysis_result: AI分析结果
+            opinion_type: 意见类型 ('notice', 'grant', 'rejection')
+            
+        Returns:
+            AsyncIterator[Dict[str, Any]]: 输出片段 {"model", "content", "done"}
+        """
+        start_time = time.time()
+        return self._stream_with_fallback(
+            self._build_opinion_messages(analysis_result, opinion_type),
+            (self.default_model,),
+            lambda: self._generate_template_opinion(opinion_type, start_time)
+        )
+    
+    async def _stream_with_fallback(
+        self,
+        messages: Messages,
+        model_names: tuple,
+        fallback: Callable[[], AIResponse]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """依次尝试各模型的流式输出，全部不可用时返回降级结果"""
+        client = self.open_async_client()
+        
+        for model_name in model_names:
+            payload = self._build_chat_payload(model_name, messages)
+            payload["stream"] = True
+            started = False
+            try:
+                async with client.stream("POST", "/api/chat", json=payload) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        print(f"模型 {model_name} 流式调用失败: HTTP {response.status_code}: {body[:200]!r}")
+                        continue
+                    
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        started = True
+                        yield {
+                            "model": model_name,
+                            "content": chunk.get("message", {}).get("content", ""),
+                            "done": chunk.get("done", False)
+                        }
+                    return
+            except (httpx.HTTPError, ValueError) as e:
+                if started:
+                    # 已输出部分内容，不再切换模型
+                    yield {"model": model_name, "content": "", "done": True, "error": str(e)}
+                    return
+                print(f"模型 {model_name} 流式调用失败: {e}")
+        
+        response = fallback()
+        yield {"model": response.model_used, "content": response.content, "done": True}
+    
+    def _get_cached(self, cache_key: str, start_time: float) -> Optional[AIResponse]:
+        """查询响应缓存，命中时返回带 cached 标记的副本"""
+        response = self.response_cache.get(cache_key)
+        if response is None:
+            return None
+        return replace(response, cached=True, processing_time=time.time() - start_time)
+    
+    def _get_semantic_cached(self, namespace: str, embedding: Optional[List[float]], start_time: float) -> Optional[AIResponse]:
+        """查询语义缓存，近似命中时折减置信度"""
+        if embedding is None:
+            return None
+        response = self.semantic_cache.get(namespace, embedding)
+        if response is None:
+            return None
+        return replace(
+            response,
+            confidence=response.confidence * self.semantic_hit_penalty,
+            cached=True,
+            processing_time=time.time() - start_time
+        )
+    
+    def _cache_response(self, cache_key: str, namespace: str, embedding: Optional[List[float]], response: AIResponse):
+        """写入精确缓存和语义缓存"""
+        self.response_cache.set(cache_key, response)
+        if embedding is not None:
+            self.semantic_cache.set(namespace, embedding, response)
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量获取文本嵌入向量，全部文本合并为一次 /api/embed 请求
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            List[List[float]]: 与 texts 顺序一致的嵌入向量
+        """
+        if not texts:
+            return []
+        response = self.session.post(
+            f"{self.ollama_base_url}/api/embed",
+            json={"model": self.embedding_model, "input": texts},
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()["embeddings"]
+    
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """批量获取文本嵌入向量（异步）"""
+        if not texts:
+            return []
+        if self.aclient is None:
+            return await asyncio.to_thread(self.embed_texts, texts)
+        
+        response = await self.aclient.post(
+            "/api/embed",
+            json={"model": self.embedding_model, "input": texts},
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()["embeddings"]
+    
+    async def _embed_text(self, text: str) -> Optional[List[float]]:
+        """获取文本嵌入向量（异步），失败或语义缓存暂停时返回None"""
+        if time.monotonic() < self._embedding_retry_at:
+            return None
+        try:
+            return (await self.aembed_texts([text]))[0]
+        except Exception as e:
+            self._pause_embedding(e)
+            return None
+    
+    def _pause_embedding(self, error: Exception):
+        """嵌入失败后暂停语义缓存，避免每次分析都多一次失败的请求"""
+        self._embedding_retry_at = time.monotonic() + EMBEDDING_RETRY_INTERVAL
+        print(f"获取文本嵌入失败，{EMBEDDING_RETRY_INTERVAL:.0f}秒内跳过语义缓存: {error}")
+    
+    async def assess_novelty_risk(
+        self,
+        patent_text: str,
+        reference_texts: List[str],
+        top_k: int = 3,
+        reference_keys: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        基于嵌入向量k近邻的新颖性风险评估（不调用生成模型）
+        
+        待评估文本和尚未缓存的参考文本在一次 /api/embed 请求中完成嵌入。
+        
+        Args:
+            patent_text: 待评估的专利文本
+            reference_texts: 参考文本（如已有申请的摘要和权利要求）
+            top_k: 返回最相似的参考文本数
+            reference_keys: 与 reference_texts 对应的缓存键（如文件内容哈希），
+                提供时参考向量只嵌入一次，之后的请求只需嵌入待评估文本
+            
+        Returns:
+            Dict[str, Any]: 最相似参考文本的下标和相似度、最高相似度及风险等级
+        """
+        if not reference_texts:
+            return {"neighbors": [], "max_similarity": 0.0, "risk_level": "low"}
+        
+        vectors: List[Optional[np.ndarray]] = [None] * len(reference_texts)
+        if reference_keys is not None:
+            vectors = self._cached_reference_embeddings(reference_keys)
+        pending = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        embeddings = self._normalize_rows(
+            await self.aembed_texts([patent_text] + [reference_texts[i] for i in pending])
+        )
+        for i, vector in zip(pending, embeddings[1:]):
+            vectors[i] = vector
+        if reference_keys is not None and pending:
+            self._store_reference_embeddings([reference_keys[i] for i in pending], embeddings[1:])
+        
+        similarities = np.stack(vectors) @ embeddings[0]
+        
+        nearest = np.argsort(-similarities)[:top_k]
+        max_similarity = float(similarities[nearest[0]])
+        if max_similarity >= NOVELTY_HIGH_RISK_SIMILARITY:
+            risk_level = "high"
+        elif max_similarity >= NOVELTY_MEDIUM_RISK_SIMILARITY:
+            risk_level = "medium"
+        else:
+            risk_level = "low"
+        
+        return {
+            "neighbors": [
+                {"index": int(index), "similarity": float(similarities[index])}
+                for index in nearest
+            ],
+            "max_similarity": max_similarity,
+            "risk_level": risk_level
+        }
+    
+    @staticmethod
+    def _normalize_rows(embeddings: List[List[float]]) -> np.ndarray:
+        """将嵌入向量转换为按行归一化的矩阵"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix
+    
+    def _cached_reference_embeddings(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """查询参考向量缓存，未缓存的位置为None"""
+        model = self.embedding_model
+        vectors: List[Optional[np.ndarray]] = []
+        with self._reference_embeddings_lock:
+            for key in keys:
+                vector = self._reference_embeddings.get((model, key))
+                if vector is not None:
+                    self._reference_embeddings.move_to_end((model, key))
+                vectors.append(vector)
+        return vectors
+    
+    def _store_reference_embeddings(self, keys: List[str], vectors: np.ndarray):
+        """写入参考向量缓存，超过容量时淘汰最久未用的条目"""
+        model = self.embedding_model
+        with self._reference_embeddings_lock:
+            for key, vector in zip(keys, vectors):
+                self._reference_embeddings[(model, key)] = vector
+                self._reference_embeddings.move_to_end((model, key))
+            while len(self._reference_embeddings) > REFERENCE_EMBEDDING_CACHE_SIZE:
+                self._reference_embeddings.popitem(last=False)
+    
+    @staticmethod
+    def _system_messages(system_prompt: str, schema_prompt: str) -> Messages:
+        """固定的系统消息：角色说明和输出格式"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": schema_prompt}
+        ]
+    
+    def _build_analysis_messages(self, patent_text: str, analysis_type: str) -> Messages:
+        """构建分析对话消息，固定的系统消息在前，专利文本在后"""
+        system_messages = self._analysis_system_messages.get(analysis_type, self._analysis_system_messages["utility"])
+        return system_messages + [
+            {"role": "user", "content": f"专利申请内容：\n{truncate_to_tokens(patent_text, ANALYSIS_TOKEN_BUDGET)}"}
+        ]
+    
+    def _build_chat_payload(self, model_name: str, messages: Messages) -> Dict[str, Any]:
+        """构建Ollama对话请求"""
+        return {
+            "model": model_name,
+            "messages": messages,
+            "stream": False,
+            "options": {
+                "temperature": 0.3,  # 降低随机性，提高一致性
+                "top_p": 0.9,
+                "max_tokens": 2000
+            }
+        }
+    
+    def _chat_response(self, model_name: str, content: str) -> AIResponse:
+        """构建模型调用成功的响应"""
+        # 尝试解析JSON响应
+        confidence = self._extract_confidence(content)
+        
+        return AIResponse(
+            success=True,
+            content=content,
+            confidence=confidence,
+            processing_time=0,  # 将在调用处设置
+            model_used=model_name
+        )
+    
+    def _error_response(self, model_name: str, error_message: str, status_code: Optional[int] = None) -> AIResponse:
+        """构建模型调用失败的响应"""
+        return AIResponse(
+            success=False,
+            content="",
+            confidence=0.0,
+            processing_time=0,
+            model_used=model_name,
+            error_message=error_message,
+            status_code=status_code
+        )
+    
+    async def _call_ollama_model(self, model_name: str, messages: Messages, timeout: Optional[float] = None) -> AIResponse:
+        """调用Ollama模型（流式读取，JSON输出完整后提前结束）"""
+        client = self.open_async_client()
+        payload = self._build_chat_payload(model_name, messages)
+        payload["stream"] = True
+        try:
+            async with client.stream(
+                "POST",
+                "/api/chat",
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=10.0) if timeout else httpx.USE_CLIENT_DEFAULT
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    return self._error_response(
+                        model_name, f"HTTP {response.status_code}: {body.decode(errors='replace')}", response.status_code
+                    )
+                
+                collector = _ChatStreamCollector()
+                async for line in response.aiter_lines():
+                    if collector.feed_line(line):
+                        break
+            return self._chat_response(model_name, collector.content)
+        
+        except httpx.TimeoutException:
+            return self._error_response(model_name, _TIMEOUT_MESSAGE)
+        except Exception as e:
+            return self._error_response(model_name, str(e))
     
     def _extract_confidence(self, content: str) -> float:
         """从AI响应中提取置信度"""
@@ -275,11 +1017,7 @@ class AIService:
         }
         
         # 简单的关键词检测
-        keywords_found = []
-        patent_keywords = ["发明", "实用新型", "技术方案", "权利要求", "技术效果"]
-        for keyword in patent_keywords:
-            if keyword in patent_text:
-                keywords_found.append(keyword)
+        keywords_found = list(_FALLBACK_KEYWORD_MATCHER.find(patent_text))
         
         analysis_result["keywords_found"] = keywords_found
         analysis_result["basic_check"] = len(keywords_found) >= 3
@@ -292,7 +1030,7 @@ class AIService:
             model_used="rule_based"
         )
     
-    def generate_examination_opinion(self, analysis_result: str, opinion_type: str = "notice") -> AIResponse:
+    async def agenerate_examination_opinion(self, analysis_result: str, opinion_type: str = "notice") -> AIResponse:
         """
         生成审查意见
         
@@ -305,35 +1043,22 @@ class AIService:
         """
         start_time = time.time()
         
-        prompt = f"""基于以下分析结果，生成标准的专利审查意见书：
-
-分析结果：
-{analysis_result}
-
-请生成{opinion_type}类型的审查意见，要求：
-1. 严格按照国家知识产权局的格式
-2. 引用准确的法律条款
-3. 逻辑清晰，理由充分
-4. 语言专业、客观
-
-请以JSON格式输出：
-{{
-    "opinion_type": "{opinion_type}",
-    "main_content": "审查意见正文",
-    "legal_basis": ["法律依据"],
-    "recommendations": ["修改建议"],
-    "deadline": "答复期限",
-    "confidence": 0.80
-}}"""
+        cache_key = ResponseCache.make_key(self.default_model, f"opinion:{opinion_type}", analysis_result)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            return cached
+        
+        messages = self._build_opinion_messages(analysis_result, opinion_type)
         
         try:
-            response = self._call_ollama_model(self.default_model, prompt)
+            response = await self._call_ollama_model(self.default_model, messages)
             if response.success:
                 response.processing_time = time.time() - start_time
+                self.response_cache.set(cache_key, response)
                 return response
-            else:
-                # 降级到模板生成
-                return self._generate_template_opinion(opinion_type, start_time)
+            
+            # 降级到模板生成
+            return self._generate_template_opinion(opinion_type, start_time)
                 
         except Exception as e:
             return AIResponse(
@@ -345,6 +1070,17 @@ class AIService:
                 error_message=f"审查意见生成失败: {str(e)}"
             )
     
+    def _build_opinion_messages(self, analysis_result: str, opinion_type: str) -> Messages:
+        """构建审查意见对话消息"""
+        system_messages = self._opinion_system_messages.get(opinion_type)
+        if system_messages is None:
+            system_messages = self._system_messages(
+                OPINION_SYSTEM_PROMPT, OPINION_SCHEMA_TEMPLATE.format(opinion_type=opinion_type)
+            )
+        return system_messages + [
+            {"role": "user", "content": f"分析结果：\n{analysis_result}"}
+        ]
+    
     def _generate_template_opinion(self, opinion_type: str, start_time: float) -> AIResponse:
         """生成模板化审查意见"""
         templates = {
@@ -4,16 +4,118 @@
 import os
 import json
 import re
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass
-import PyPDF2
-import pdfplumber
-from docx import Document
-from PIL import Image
-import pytesseract
+import pypdfium2 as pdfium
+from charset_normalizer import from_bytes
 
-@dataclass
+# 专利信息提取使用的正则表达式（预编译）
+_RE_APP_NO = re.compile(r'申请号[：:]\s*(\d{13}|\d{4}\d{8})')
+_RE_DATE = re.compile(r'申请日[：:]\s*(\d{4}[年.-]\d{1,2}[月.-]\d{1,2})')
+_RE_TITLES = [
+    re.compile(r'发明名称[：:]\s*(.+?)(?:\n|申请人)'),
+    re.compile(r'实用新型名称[：:]\s*(.+?)(?:\n|申请人)'),
+    re.compile(r'名\s*称[：:]\s*(.+?)(?:\n|申请人)')
+]
+_RE_APPLICANT = re.compile(r'申请人[：:]\s*(.+?)(?:\n|发明人|地址)')
+_RE_INVENTOR = re.compile(r'发明人[：:]\s*(.+?)(?:\n|申请人|地址)')
+_RE_FIELDS = [
+    re.compile(r'技术领域\s*(.+?)(?=背景技术|发明内容|\n\s*\n)', re.DOTALL),
+    re.compile(r'所属技术领域\s*(.+?)(?=背景技术|发明内容|\n\s*\n)', re.DOTALL)
+]
+_RE_BG = re.compile(r'背景技术\s*(.+?)(?=发明内容|技术方案|\n\s*\n)', re.DOTALL)
+_RE_CONTENT = re.compile(r'发明内容\s*(.+?)(?=具体实施方式|附图说明|\n\s*\n)', re.DOTALL)
+_RE_CLAIMS = re.compile(r'权利要求书\s*(.+?)(?=说明书|附图说明|$)', re.DOTALL)
+_RE_CLAIM_ITEM = re.compile(r'(\d+)\.\s*(.+?)(?=\d+\.|$)', re.DOTALL)
+_RE_ABSTRACT = re.compile(r'摘\s*要\s*(.+?)(?=附图说明|权利要求|$)', re.DOTALL)
+
+# 一次扫描定位所有字段标签，各字段正则只在标签位置上匹配。
+# 可能互相重叠的标签只消耗不重叠的前缀（如"背景技术领域"中的"技术领域"、
+# "发明名称"中的"名称"），保证每个标签位置都能被找到。
+_RE_LABELS = re.compile(r'申请[号日人]|发明(?=名称|人|内容)|实用新型(?=名称)|名\s*称|技术领域|背(?=景技术)|权利要求书|摘\s*要')
+# 标签首字（"申请""发明"取前三字）到字段正则的映射
+_LABEL_PATTERNS = {
+    "申请号": _RE_APP_NO,
+    "申请日": _RE_DATE,
+    "申请人": _RE_APPLICANT,
+    "发明名": _RE_TITLES[0],
+    "发明人": _RE_INVENTOR,
+    "发明内": _RE_CONTENT,
+    "实": _RE_TITLES[1],
+    "名": _RE_TITLES[2],
+    "技": _RE_FIELDS[0],
+    "背": _RE_BG,
+    "权": _RE_CLAIMS,
+    "摘": _RE_ABSTRACT
+}
+
+# 文档验证使用的日期分隔符
+_DATE_YEAR_SEPARATORS = "年.-"
+_DATE_MONTH_SEPARATORS = "月.-"
+
+def _is_valid_application_number(value: str) -> bool:
+    """申请号为12位或13位数字"""
+    return len(value) in (12, 13) and value.isdecimal()
+
+def _take_number(value: str, start: int, max_digits: int) -> Tuple[int, int]:
+    """从 start 开始读取至多 max_digits 位数字，返回 (数值, 结束位置)，没有数字时数值为-1"""
+    end = start
+    while end < len(value) and end - start < max_digits and value[end].isdecimal():
+        end += 1
+    return (int(value[start:end]) if end > start else -1), end
+
+def _is_valid_date(value: str) -> bool:
+    """日期以 年-月-日 开头，如 2021年12月15日、2021.12.15、2021-1-5"""
+    if len(value) < 8 or not value[:4].isdecimal() or value[4] not in _DATE_YEAR_SEPARATORS:
+        return False
+    month, end = _take_number(value, 5, 2)
+    if not 1 <= month <= 12 or end >= len(value) or value[end] not in _DATE_MONTH_SEPARATORS:
+        return False
+    day, _ = _take_number(value, end + 1, 2)
+    return 1 <= day <= 31
+
+# 页数达到该值时用多进程并行提取PDF页面文本，页数少时进程间通信开销大于收益
+PARALLEL_PDF_MIN_PAGES = 4
+
+# 文本文件依次尝试的编码，均失败时自动检测
+TEXT_ENCODINGS = ("utf-8", "gbk")
+
+def _extract_pages(pages) -> List[str]:
+    """依次提取pdfplumber页面文本，并释放已处理页面的布局缓存"""
+    texts = []
+    for page in pages:
+        texts.append(page.extract_text())
+        page.flush_cache()
+    return texts
+
+def _extract_pdfium_pages(file_path: Path) -> List[str]:
+    """使用PDFium提取全部页面文本（统一为\n换行）"""
+    pdf = pdfium.PdfDocument(str(file_path))
+    try:
+        texts = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        pdf.close()
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """提取指定页码范围的文本（在子进程中执行，需为模块级函数以便序列化）"""
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        return _extract_pages(pdf.pages[start:stop])
+
+@dataclass(slots=True)
 class PatentDocument:
     """专利文档数据结构"""
     application_number: Optional[str] = None
@@ -25,7 +127,7 @@ class PatentDocument:
     technical_field: Optional[str] = None
     background_art: Optional[str] = None
     invention_content: Optional[str] = None
-    claims: List[str] = None
+    claims: List[Tuple[str, str]] = None  # (序号原文, 内容)
     description: Optional[str] = None
     drawings: List[str] = None
     abstract: Optional[str] = None
@@ -35,17 +137,47 @@ class PatentDocument:
             self.claims = []
         if self.drawings is None:
             self.drawings = []
+    
+    @property
+    def formatted_claims(self) -> List[str]:
+        """权利要求文本列表，每项格式为“序号. 内容”"""
+        return [f"{num}. {content}" for num, content in self.claims]
+    
+    @classmethod
+    def from_patent_data(cls, patent_data: Dict[str, Any]) -> "PatentDocument":
+        """由已保存的专利数据（权利要求为格式化文本）构建文档对象"""
+        claims = []
+        for index, claim in enumerate(patent_data.get("claims") or [], 1):
+            num, separator, content = claim.partition(". ")
+            claims.append((num, content) if separator and num.isdecimal() else (str(index), claim))
+        return cls(**{**patent_data, "claims": claims})
+
+@dataclass(slots=True)
+class ValidationResult:
+    """文档验证结果"""
+    errors: List[str]
+    warnings: List[str]
 
 class DocumentParser:
     """文档解析器"""
     
-    def __init__(self):
+    def __init__(self, cache_size: int = 256, max_workers: Optional[int] = None):
         self.supported_formats = ['.pdf', '.doc', '.docx', '.txt']
+        # 解析结果缓存: 路径 -> (mtime_ns, size, 解析结果, 元数据)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, int, PatentDocument, Dict]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # PDF页面并行提取使用的进程池，首次需要时创建
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
         
     def parse_document(self, file_path: str) -> Tuple[PatentDocument, Dict]:
         """
         解析专利文档
         
+        文件未变化（修改时间和大小相同）时直接返回缓存的解析结果。
+        
         Args:
             file_path: 文档文件路径
             
@@ -60,15 +192,77 @@ class DocumentParser:
         if file_path.suffix.lower() not in self.supported_formats:
             raise ValueError(f"不支持的文件格式: {file_path.suffix}")
         
+        cache_key = str(file_path)
+        stat = file_path.stat()
+        with self._cache_lock:
+            entry = self._cache.get(cache_key)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                self._cache.move_to_end(cache_key)
+                return entry[2], dict(entry[3])
+        
         try:
             if file_path.suffix.lower() == '.pdf':
-                return self._parse_pdf(file_path)
+                patent_doc, metadata = self._parse_pdf(file_path)
             elif file_path.suffix.lower() in ['.doc', '.docx']:
-                return self._parse_word(file_path)
-            elif file_path.suffix.lower() == '.txt':
-                return self._parse_text(file_path)
+                patent_doc, metadata = self._parse_word(file_path)
+            else:
+                patent_doc, metadata = self._parse_text(file_path)
         except Exception as e:
             raise Exception(f"文档解析失败: {str(e)}")
+        
+        with self._cache_lock:
+            self._cache[cache_key] = (stat.st_mtime_ns, stat.st_size, patent_doc, metadata)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return patent_doc, dict(metadata)
+    
+    def invalidate(self, file_path: str):
+        """移除指定文件的解析缓存"""
+        with self._cache_lock:
+            self._cache.pop(str(Path(file_path)), None)
+    
+    def shutdown(self):
+        """关闭PDF解析进程池"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # 使用spawn启动子进程，避免在多线程的服务进程中fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+    
+    def _extract_pages_parallel(self, file_path: Path, page_count: int) -> List[str]:
+        """将页面按连续区间分给各子进程提取，按页码顺序返回文本"""
+        workers = min(self.max_workers, page_count)
+        chunk, extra = divmod(page_count, workers)
+        bounds = []
+        start = 0
+        for i in range(workers):
+            stop = start + chunk + (1 if i < extra else 0)
+            bounds.append((start, stop))
+            start = stop
+        
+        try:
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_extract_page_range, str(file_path), start, stop)
+                for start, stop in bounds
+            ]
+            return [text for future in futures for text in future.result()]
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可再用，下次重新创建
+            with self._executor_lock:
+                self._executor = None
+            raise
     
     def _parse_pdf(self, file_path: Path) -> Tuple[PatentDocument, Dict]:
         """解析PDF文档"""
@@ -76,38 +270,65 @@ class DocumentParser:
             "file_size": file_path.stat().st_size,
             "file_type": "PDF",
             "pages": 0,
-            "parsing_method": "pdfplumber"
+            "parsing_method": "pypdfium2"
         }
         
-        text_content = ""
+        try:
+            # 优先使用PDFium（原生实现）提取文本
+            page_texts = _extract_pdfium_pages(file_path)
+            metadata["pages"] = len(page_texts)
+            parts = [page_text for page_text in page_texts if page_text]
+        except Exception:
+            parts = None
         
+        if parts is None:
+            parts = self._parse_pdf_fallback(file_path, metadata)
+        
+        # 逐页收集文本后一次性拼接，避免字符串反复复制
+        text_content = "".join(f"{part}\n" for part in parts)
+        
+        # 解析文本内容
+        patent_doc = self._extract_patent_info(text_content)
+        
+        return patent_doc, metadata
+    
+    def _parse_pdf_fallback(self, file_path: Path, metadata: Dict) -> List[str]:
+        """
+        PDFium无法解析时依次尝试pdfplumber和PyPDF2，返回各页文本
+        
+        两者只在降级时用到，按需导入以减少启动时间和内存占用。
+        """
+        metadata["parsing_method"] = "pdfplumber"
         try:
             # 使用pdfplumber解析PDF
+            import pdfplumber
             with pdfplumber.open(file_path) as pdf:
                 metadata["pages"] = len(pdf.pages)
-                
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_content += page_text + "\n"
+                parallel = metadata["pages"] >= PARALLEL_PDF_MIN_PAGES and self.max_workers > 1
+                if not parallel:
+                    page_texts = _extract_pages(pdf.pages)
+            
+            if parallel:
+                # 页面布局分析是CPU密集型，多页文档分给多个进程
+                page_texts = self._extract_pages_parallel(file_path, metadata["pages"])
+            parts = [page_text for page_text in page_texts if page_text]
                         
         except Exception as e:
             # 降级到PyPDF2
             metadata["parsing_method"] = "PyPDF2"
+            parts = []
             try:
+                import PyPDF2
                 with open(file_path, 'rb') as file:
                     pdf_reader = PyPDF2.PdfReader(file)
                     metadata["pages"] = len(pdf_reader.pages)
                     
                     for page in pdf_reader.pages:
-                        text_content += page.extract_text() + "\n"
+                        parts.append(page.extract_text())
             except Exception as e2:
                 raise Exception(f"PDF解析失败: {str(e2)}")
         
-        # 解析文本内容
-        patent_doc = self._extract_patent_info(text_content)
-        
-        return patent_doc, metadata
+        return parts
     
     def _parse_word(self, file_path: Path) -> Tuple[PatentDocument, Dict]:
         """解析Word文档"""
@@ -118,19 +339,18 @@ class DocumentParser:
         }
         
         try:
+            from docx import Document
             doc = Document(file_path)
             
             # 提取文本内容
-            text_content = ""
-            for paragraph in doc.paragraphs:
-                text_content += paragraph.text + "\n"
+            parts = [paragraph.text for paragraph in doc.paragraphs]
             
-            # 提取表格内容
+            # 提取表格内容（每行单元格以制表符结尾）
             for table in doc.tables:
                 for row in table.rows:
-                    for cell in row.cells:
-                        text_content += cell.text + "\t"
-                    text_content += "\n"
+                    parts.append("".join(f"{cell.text}\t" for cell in row.cells))
+            
+            text_content = "".join(f"{part}\n" for part in parts)
             
             metadata["paragraphs"] = len(doc.paragraphs)
             metadata["tables"] = len(doc.tables)
@@ -151,101 +371,118 @@ class DocumentParser:
             "parsing_method": "text"
         }
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text_content = file.read()
-        except UnicodeDecodeError:
-            # 尝试GBK编码
-            with open(file_path, 'r', encoding='gbk') as file:
-                text_content = file.read()
-                metadata["encoding"] = "gbk"
+        # 只读取一次文件，在内存中依次尝试解码
+        raw = file_path.read_bytes()
+        text_content, encoding = self._decode_text(raw)
+        # 按字节读取没有通用换行转换，统一换行符（与文本模式 open() 一致）
+        text_content = text_content.replace("\r\n", "\n").replace("\r", "\n")
+        if encoding != "utf-8":
+            metadata["encoding"] = encoding
         
         # 解析文本内容
         patent_doc = self._extract_patent_info(text_content)
         
         return patent_doc, metadata
     
+    def _decode_text(self, raw: bytes) -> Tuple[str, str]:
+        """
+        解码文本文件内容
+        
+        先尝试UTF-8和GBK；都失败时由 charset_normalizer 检测编码。
+        短文本的检测结果不可靠（GBK常被识别为韩文编码），因此不先做检测。
+        
+        Returns:
+            Tuple[str, str]: 文本内容和使用的编码
+        """
+        for encoding in TEXT_ENCODINGS:
+            try:
+                return raw.decode(encoding), encoding
+            except UnicodeDecodeError:
+                continue
+        
+        best = from_bytes(raw).best()
+        if best is None:
+            raise ValueError("无法识别文本文件编码")
+        return str(best), best.encoding
+    
     def _extract_patent_info(self, text: str) -> PatentDocument:
         """从文本中提取专利信息"""
         patent_doc = PatentDocument()
         
+        # 一次扫描记录各字段标签出现的位置
+        positions: Dict[re.Pattern, List[int]] = {}
+        for match in _RE_LABELS.finditer(text):
+            start = match.start()
+            key = text[start:start + 3] if match.group().startswith(("申请", "发明")) else text[start]
+            positions.setdefault(_LABEL_PATTERNS[key], []).append(start)
+        
+        def first_match(pattern: re.Pattern, at: Optional[re.Pattern] = None, offset: int = 0) -> Optional[re.Match]:
+            """在标签位置上依次尝试匹配，返回第一个成功的结果（与 pattern.search 等价）"""
+            for pos in positions.get(at or pattern, ()):
+                match = pattern.match(text, pos + offset) if pos + offset >= 0 else None
+                if match:
+                    return match
+            return None
+        
         # 申请号提取
-        app_number_pattern = r'申请号[：:]\s*(\d{13}|\d{4}\d{8})'
-        match = re.search(app_number_pattern, text)
+        match = first_match(_RE_APP_NO)
         if match:
             patent_doc.application_number = match.group(1)
         
         # 申请日期提取
-        date_pattern = r'申请日[：:]\s*(\d{4}[年.-]\d{1,2}[月.-]\d{1,2})'
-        match = re.search(date_pattern, text)
+        match = first_match(_RE_DATE)
         if match:
             patent_doc.application_date = match.group(1)
         
         # 发明名称提取
-        title_patterns = [
-            r'发明名称[：:]\s*(.+?)(?:\n|申请人)',
-            r'实用新型名称[：:]\s*(.+?)(?:\n|申请人)',
-            r'名\s*称[：:]\s*(.+?)(?:\n|申请人)'
-        ]
-        for pattern in title_patterns:
-            match = re.search(pattern, text)
+        for pattern in _RE_TITLES:
+            match = first_match(pattern)
             if match:
                 patent_doc.title = match.group(1).strip()
                 break
         
         # 申请人提取
-        applicant_pattern = r'申请人[：:]\s*(.+?)(?:\n|发明人|地址)'
-        match = re.search(applicant_pattern, text)
+        match = first_match(_RE_APPLICANT)
         if match:
             patent_doc.applicant = match.group(1).strip()
         
         # 发明人提取
-        inventor_pattern = r'发明人[：:]\s*(.+?)(?:\n|申请人|地址)'
-        match = re.search(inventor_pattern, text)
+        match = first_match(_RE_INVENTOR)
         if match:
             patent_doc.inventor = match.group(1).strip()
         
-        # 技术领域提取
-        field_patterns = [
-            r'技术领域\s*(.+?)(?=背景技术|发明内容|\n\s*\n)',
-            r'所属技术领域\s*(.+?)(?=背景技术|发明内容|\n\s*\n)'
-        ]
-        for pattern in field_patterns:
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                patent_doc.technical_field = match.group(1).strip()
-                break
+        # 技术领域提取（"所属技术领域"位于"技术领域"标签前两个字符）
+        match = first_match(_RE_FIELDS[0]) or first_match(_RE_FIELDS[1], at=_RE_FIELDS[0], offset=-2)
+        if match:
+            patent_doc.technical_field = match.group(1).strip()
         
         # 背景技术提取
-        bg_pattern = r'背景技术\s*(.+?)(?=发明内容|技术方案|\n\s*\n)'
-        match = re.search(bg_pattern, text, re.DOTALL)
+        match = first_match(_RE_BG)
         if match:
             patent_doc.background_art = match.group(1).strip()
         
         # 发明内容提取
-        content_pattern = r'发明内容\s*(.+?)(?=具体实施方式|附图说明|\n\s*\n)'
-        match = re.search(content_pattern, text, re.DOTALL)
+        match = first_match(_RE_CONTENT)
         if match:
             patent_doc.invention_content = match.group(1).strip()
         
         # 权利要求提取
-        claims_pattern = r'权利要求书\s*(.+?)(?=说明书|附图说明|$)'
-        match = re.search(claims_pattern, text, re.DOTALL)
+        match = first_match(_RE_CLAIMS)
         if match:
             claims_text = match.group(1)
             # 分离各项权利要求
-            claim_items = re.findall(r'(\d+)\.\s*(.+?)(?=\d+\.|$)', claims_text, re.DOTALL)
-            patent_doc.claims = [f"{num}. {content.strip()}" for num, content in claim_items]
+            claim_items = _RE_CLAIM_ITEM.findall(claims_text)
+            # 保留序号原文（如“01”、全角数字），保存的权利要求文本与原文一致
+            patent_doc.claims = [(num, content.strip()) for num, content in claim_items]
         
         # 摘要提取
-        abstract_pattern = r'摘\s*要\s*(.+?)(?=附图说明|权利要求|$)'
-        match = re.search(abstract_pattern, text, re.DOTALL)
+        match = first_match(_RE_ABSTRACT)
         if match:
             patent_doc.abstract = match.group(1).strip()
         
         return patent_doc
     
-    def validate_document(self, patent_doc: PatentDocument) -> Dict[str, List[str]]:
+    def validate_document(self, patent_doc: PatentDocument) -> ValidationResult:
         """
         验证文档完整性
         
@@ -253,10 +490,10 @@ class DocumentParser:
             patent_doc: 专利文档对象
             
         Returns:
-            Dict[str, List[str]]: 验证结果，包含错误和警告
+            ValidationResult: 验证结果，包含错误和警告
         """
-        errors = []
-        warnings = []
+        errors: List[str] = []
+        warnings: List[str] = []
         
         # 必填字段检查
         if not patent_doc.title:
@@ -273,24 +510,19 @@ class DocumentParser:
         
         # 格式检查
         if patent_doc.application_number:
-            if not re.match(r'^\d{13}$|^\d{12}$', patent_doc.application_number):
+            if not _is_valid_application_number(patent_doc.application_number):
                 warnings.append("申请号格式可能不正确")
         
         if patent_doc.application_date:
-            if not re.match(r'\d{4}[年.-]\d{1,2}[月.-]\d{1,2}', patent_doc.application_date):
+            if not _is_valid_date(patent_doc.application_date):
                 warnings.append("申请日期格式可能不正确")
         
         # 内容完整性检查
-        if patent_doc.claims and len(patent_doc.claims) == 0:
-            errors.append("权利要求书为空")
-        
-        if patent_doc.title and len(patent_doc.title) > 25:
+        title_length = len(patent_doc.title) if patent_doc.title else 0
+        if title_length > 25:
             warnings.append("发明名称过长（建议不超过25字）")
         
-        return {
-            "errors": errors,
-            "warnings": warnings
-        }
+        return ValidationResult(errors=errors, warnings=warnings)
 
 # 创建全局解析器实例
 document_parser = DocumentParser()
\ No newline at end of file
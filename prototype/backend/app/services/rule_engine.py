@@ -1,12 +1,58 @@
 """
 规则引擎服务
 """
+import bisect
+import heapq
 import json
 import re
-from typing import Dict, List, Any, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
-from enum import Enum
-from datetime import datetime
+from functools import lru_cache
+from enum import Enum, IntEnum
+
+from ..utils.keyword_matcher import KeywordMatcher
+
+# 符合实用新型的关键词
+SUBJECT_MATTER_POSITIVE_KEYWORDS = (
+    "形状", "构造", "结构", "零件", "部件", "装置", "机构",
+    "连接", "固定", "安装", "组合", "配合", "嵌入"
+)
+
+# 不符合实用新型的关键词
+SUBJECT_MATTER_NEGATIVE_KEYWORDS = (
+    "方法", "工艺", "步骤", "流程", "算法", "软件", "程序",
+    "配方", "组合物", "材料", "成分", "比例", "液体", "气体"
+)
+
+# 正向关键词标记为1、负向为-1，按定义顺序保存以保证匹配结果顺序稳定
+SUBJECT_MATTER_KEYWORD_POLARITY: Dict[str, int] = {
+    **{keyword: 1 for keyword in SUBJECT_MATTER_POSITIVE_KEYWORDS},
+    **{keyword: -1 for keyword in SUBJECT_MATTER_NEGATIVE_KEYWORDS}
+}
+
+# 所有保护客体规则共享的关键词匹配器，首次创建规则时构建
+_subject_matter_matcher: Optional[KeywordMatcher] = None
+_subject_matter_matcher_lock = threading.Lock()
+
+# 保护客体关键词扫描结果缓存条数（同一草稿修改后重复提交时直接复用）
+SCAN_CACHE_SIZE = 1024
+
+# 权利要求扫描：一次扫描同时识别特征部分和从属引用
+_RE_CLAIM_SCAN = re.compile(
+    r'(?P<feat>其特征在于|其特征是)|'
+    r'(?P<dep>根据权利要求|按照权利要求)'
+)
+
+def _has_num_prefix(text: str) -> bool:
+    r"""是否以“数字+.”开头（等价于 re.match(r'\d+\.')，免去进入正则引擎）"""
+    i = 0
+    n = len(text)
+    while i < n and text[i].isdecimal():
+        i += 1
+    return 0 < i < n and text[i] == "."
 
 class RuleType(Enum):
     """规则类型"""
@@ -16,14 +62,21 @@ class RuleType(Enum):
     UTILITY = "utility"         # 实用性
     SUBJECT_MATTER = "subject_matter"  # 保护客体
 
-class RuleResult(Enum):
-    """规则执行结果"""
-    PASS = "pass"
-    FAIL = "fail"
-    WARNING = "warning"
-    SKIP = "skip"
+class RuleResult(IntEnum):
+    """规则执行结果（整数编码，可直接作为计数数组下标）"""
+    PASS = 0
+    FAIL = 1
+    WARNING = 2
+    SKIP = 3
+    
+    @property
+    def label(self) -> str:
+        """接口和审查记录中使用的结果名称"""
+        return _RULE_RESULT_LABELS[self]
 
-@dataclass
+_RULE_RESULT_LABELS = ("pass", "fail", "warning", "skip")
+
+@dataclass(slots=True, frozen=True)
 class RuleExecutionResult:
     """规则执行结果"""
     rule_name: str
@@ -37,49 +90,71 @@ class RuleExecutionResult:
 class ExaminationRule:
     """审查规则基类"""
     
+    # 任一规则启用状态变化时递增，RuleEngine据此判断编译结果是否过期
+    active_generation = 0
+    
     def __init__(self, name: str, rule_type: RuleType, priority: int = 0):
         self.name = name
         self.rule_type = rule_type
         self.priority = priority
         self.is_active = True
     
+    @property
+    def is_active(self) -> bool:
+        return self._is_active
+    
+    @is_active.setter
+    def is_active(self, value: bool):
+        self._is_active = value
+        ExaminationRule.active_generation += 1
+    
     def execute(self, patent_data: Dict[str, Any]) -> RuleExecutionResult:
         """执行规则"""
         raise NotImplementedError("子类必须实现execute方法")
+    
+    def execute_batch(self, patent_list: List[Dict[str, Any]]) -> List[RuleExecutionResult]:
+        """对多份专利数据执行规则，子类可覆盖以合并各文档的公共处理"""
+        return [self.execute(patent_data) for patent_data in patent_list]
 
 class DocumentCompletenessRule(ExaminationRule):
     """文档完整性检查规则"""
     
     def __init__(self):
         super().__init__("文档完整性检查", RuleType.FORMAL, priority=1)
-        self.required_fields = [
+        self.required_fields = (
             "title",           # 发明名称
             "applicant",       # 申请人
             "claims",          # 权利要求书
             "description"      # 说明书
-        ]
-        self.recommended_fields = [
+        )
+        self.recommended_fields = (
             "abstract",        # 摘要
             "technical_field", # 技术领域
             "background_art",  # 背景技术
             "invention_content" # 发明内容
-        ]
+        )
+        
+        # 第i位对应 _fields[i]，必需字段在低位、推荐字段在高位
+        self._fields = self.required_fields + self.recommended_fields
+        self._required_mask = (1 << len(self.required_fields)) - 1
+        self._all_mask = (1 << len(self._fields)) - 1
+    
+    def _field_names(self, mask: int) -> List[str]:
+        """将字段位图还原为字段名列表"""
+        return [field for i, field in enumerate(self._fields) if mask >> i & 1]
     
     def execute(self, patent_data: Dict[str, Any]) -> RuleExecutionResult:
-        start_time = datetime.now()
-        
-        missing_required = []
-        missing_recommended = []
+        start_ns = time.perf_counter_ns()
         
-        # 检查必需字段
-        for field in self.required_fields:
-            if not patent_data.get(field):
-                missing_required.append(field)
+        # 一次遍历得到已填写字段的位图，全部填写时无需构建缺失列表
+        present_mask = 0
+        for i, field in enumerate(self._fields):
+            if patent_data.get(field):
+                present_mask |= 1 << i
         
-        # 检查推荐字段
-        for field in self.recommended_fields:
-            if not patent_data.get(field):
-                missing_recommended.append(field)
+        missing_mask = self._all_mask & ~present_mask
+        missing_required = self._field_names(missing_mask & self._required_mask) if missing_mask else []
+        missing_recommended = self._field_names(missing_mask & ~self._required_mask) if missing_mask else []
         
         # 判断结果
         if missing_required:
@@ -95,7 +170,7 @@ class DocumentCompletenessRule(ExaminationRule):
             message = "文档完整性检查通过"
             confidence = 0.90
         
-        execution_time = (datetime.now() - start_time).total_seconds()
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         return RuleExecutionResult(
             rule_name=self.name,
@@ -117,41 +192,71 @@ class SubjectMatterRule(ExaminationRule):
     def __init__(self):
         super().__init__("保护客体判断", RuleType.SUBJECT_MATTER, priority=2)
         
-        # 符合实用新型的关键词
-        self.positive_keywords = [
-            "形状", "构造", "结构", "零件", "部件", "装置", "机构",
-            "连接", "固定", "安装", "组合", "配合", "嵌入"
-        ]
+        self.positive_keywords = frozenset(SUBJECT_MATTER_POSITIVE_KEYWORDS)
+        self.negative_keywords = frozenset(SUBJECT_MATTER_NEGATIVE_KEYWORDS)
         
-        # 不符合实用新型的关键词
-        self.negative_keywords = [
-            "方法", "工艺", "步骤", "流程", "算法", "软件", "程序",
-            "配方", "组合物", "材料", "成分", "比例", "液体", "气体"
-        ]
+        # 一次扫描同时找出两类关键词
+        self._keyword_matcher = self._shared_matcher()
+        # 按分析文本缓存扫描结果
+        self._scan = lru_cache(maxsize=SCAN_CACHE_SIZE)(self._scan_keywords)
     
-    def execute(self, patent_data: Dict[str, Any]) -> RuleExecutionResult:
-        start_time = datetime.now()
-        
-        # 获取分析文本
-        text_to_analyze = ""
-        if patent_data.get("title"):
-            text_to_analyze += patent_data["title"] + " "
-        if patent_data.get("claims"):
-            text_to_analyze += " ".join(patent_data["claims"]) + " "
-        if patent_data.get("invention_content"):
-            text_to_analyze += patent_data["invention_content"]
-        
-        # 关键词匹配
-        positive_matches = []
-        negative_matches = []
-        
-        for keyword in self.positive_keywords:
-            if keyword in text_to_analyze:
-                positive_matches.append(keyword)
+    @staticmethod
+    def _shared_matcher() -> KeywordMatcher:
+        """
+        获取共享的关键词匹配器
         
-        for keyword in self.negative_keywords:
-            if keyword in text_to_analyze:
-                negative_matches.append(keyword)
+        自动机构建后只读，所有规则实例和线程共用同一份，避免重复构建。
+        """
+        global _subject_matter_matcher
+        if _subject_matter_matcher is None:
+            with _subject_matter_matcher_lock:
+                if _subject_matter_matcher is None:
+                    _subject_matter_matcher = KeywordMatcher(SUBJECT_MATTER_KEYWORD_POLARITY)
+        return _subject_matter_matcher
+    
+    @staticmethod
+    def _analysis_text(patent_data: Dict[str, Any]) -> str:
+        """获取分析文本（各部分一次拼接）"""
+        parts = []
+        if title := patent_data.get("title"):
+            parts.append(title)
+        if claims := patent_data.get("claims"):
+            parts.extend(claims)
+        if invention_content := patent_data.get("invention_content"):
+            parts.append(invention_content)
+        return " ".join(parts)
+    
+    def _scan_keywords(self, text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """扫描文本，返回命中的正向和负向关键词（按定义顺序）"""
+        # 判断结果确定后也不能提前结束：审查意见和结果详情需要列出全部命中的关键词
+        hits = self._keyword_matcher.find(text)
+        return (
+            tuple(keyword for keyword, polarity in hits.items() if polarity > 0),
+            tuple(keyword for keyword, polarity in hits.items() if polarity < 0)
+        )
+    
+    def execute(self, patent_data: Dict[str, Any]) -> RuleExecutionResult:
+        start_ns = time.perf_counter_ns()
+        return self._evaluate(self._scan(self._analysis_text(patent_data)), start_ns)
+    
+    def execute_batch(self, patent_list: List[Dict[str, Any]]) -> List[RuleExecutionResult]:
+        """先对全部文档完成关键词扫描，再逐个判断；扫描耗时平均计入各文档"""
+        if not patent_list:
+            return []
+        scan_start_ns = time.perf_counter_ns()
+        scan = self._scan
+        hit_sets = [scan(self._analysis_text(patent_data)) for patent_data in patent_list]
+        scan_ns = (time.perf_counter_ns() - scan_start_ns) // len(patent_list)
+        
+        return [
+            self._evaluate(hits, time.perf_counter_ns() - scan_ns)
+            for hits in hit_sets
+        ]
+    
+    def _evaluate(self, hits: Tuple[Tuple[str, ...], Tuple[str, ...]], start_ns: int) -> RuleExecutionResult:
+        """根据关键词命中结果判断保护客体"""
+        positive_matches = list(hits[0])
+        negative_matches = list(hits[1])
         
         # 判断逻辑
         positive_score = len(positive_matches)
@@ -170,7 +275,7 @@ class SubjectMatterRule(ExaminationRule):
             message = "保护客体需要进一步确认"
             confidence = 0.60
         
-        execution_time = (datetime.now() - start_time).total_seconds()
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         return RuleExecutionResult(
             rule_name=self.name,
@@ -194,7 +299,7 @@ class ClaimsFormatRule(ExaminationRule):
         super().__init__("权利要求书格式检查", RuleType.FORMAL, priority=3)
     
     def execute(self, patent_data: Dict[str, Any]) -> RuleExecutionResult:
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         claims = patent_data.get("claims", [])
         if not claims:
@@ -205,7 +310,7 @@ class ClaimsFormatRule(ExaminationRule):
                 confidence=0.95,
                 message="缺少权利要求书",
                 details={"claims_count": 0},
-                execution_time=(datetime.now() - start_time).total_seconds()
+                execution_time=(time.perf_counter_ns() - start_ns) / 1e9
             )
         
         issues = []
@@ -217,19 +322,20 @@ class ClaimsFormatRule(ExaminationRule):
         
         for i, claim in enumerate(claims):
             claim_text = claim.strip()
+            hits = {m.lastgroup for m in _RE_CLAIM_SCAN.finditer(claim_text)}
             
             # 检查编号格式
-            if not re.match(r'^\d+\.', claim_text):
+            if not _has_num_prefix(claim_text):
                 issues.append(f"权利要求{i+1}缺少正确的编号格式")
             
             # 判断独立/从属权利要求
-            if "根据权利要求" in claim_text or "按照权利要求" in claim_text:
+            if "dep" in hits:
                 dependent_claims.append(i+1)
             else:
                 independent_claims.append(i+1)
             
             # 检查特征部分
-            if "其特征在于" not in claim_text and "其特征是" not in claim_text:
+            if "feat" not in hits:
                 if i == 0:  # 第一项权利要求
                     warnings.append("独立权利要求建议包含'其特征在于'")
         
@@ -253,7 +359,7 @@ class ClaimsFormatRule(ExaminationRule):
             message = "权利要求书格式检查通过"
             confidence = 0.80
         
-        execution_time = (datetime.now() - start_time).total_seconds()
+        execution_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         return RuleExecutionResult(
             rule_name=self.name,
@@ -274,8 +380,17 @@ class ClaimsFormatRule(ExaminationRule):
 class RuleEngine:
     """规则引擎"""
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 8):
         self.rules: List[ExaminationRule] = []
+        # 按规则类型分组的 (在 rules 中的位置, 规则)，规则列表变化时重建
+        self._rules_by_type: Dict[RuleType, List[Tuple[int, ExaminationRule]]] = {}
+        # 并行执行规则的线程池，首次执行多条规则时创建
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 规则列表变化时递增；_compiled 保存 (生成时的版本, 编译后的执行函数)
+        self._generation = 0
+        self._compiled: Optional[Tuple[Tuple[int, int], Callable[[Dict[str, Any]], List[RuleExecutionResult]]]] = None
         self._initialize_default_rules()
     
     def _initialize_default_rules(self):
@@ -288,20 +403,125 @@ class RuleEngine:
         
         # 按优先级排序
         self.rules.sort(key=lambda x: x.priority)
+        self._index_rules()
     
     def add_rule(self, rule: ExaminationRule):
-        """添加规则"""
-        self.rules.append(rule)
-        self.rules.sort(key=lambda x: x.priority)
+        """添加规则（插入到相同优先级的已有规则之后）"""
+        bisect.insort(self.rules, rule, key=lambda x: x.priority)
+        self._index_rules()
     
     def remove_rule(self, rule_name: str):
         """移除规则"""
         self.rules = [rule for rule in self.rules if rule.name != rule_name]
+        self._index_rules()
+    
+    def _index_rules(self):
+        """规则列表变化后重建类型分组，并使编译结果失效"""
+        rules_by_type: Dict[RuleType, List[Tuple[int, ExaminationRule]]] = {}
+        for position, rule in enumerate(self.rules):
+            rules_by_type.setdefault(rule.rule_type, []).append((position, rule))
+        self._rules_by_type = rules_by_type
+        self._generation += 1
+    
+    def filter_rules(self, rule_types: Optional[List[RuleType]] = None) -> List[ExaminationRule]:
+        """
+        筛选需要执行的规则
+        
+        Args:
+            rule_types: 要执行的规则类型，None表示所有规则
+            
+        Returns:
+            List[ExaminationRule]: 按优先级排序的已启用规则
+        """
+        if not rule_types:
+            return [rule for rule in self.rules if rule.is_active]
+        
+        # 只遍历所选类型的分组，按在 rules 中的位置合并以保持优先级顺序
+        buckets = [self._rules_by_type.get(rule_type, ()) for rule_type in dict.fromkeys(rule_types)]
+        return [rule for _, rule in heapq.merge(*buckets) if rule.is_active]
+    
+    def shutdown(self):
+        """关闭规则执行线程池"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, max(len(self.rules), 1)),
+                    thread_name_prefix="rule-engine"
+                )
+            return self._executor
+    
+    def execute_rule(self, patent_data: Dict[str, Any], rule: ExaminationRule) -> RuleExecutionResult:
+        """执行单条规则，执行失败时返回SKIP结果"""
+        try:
+            return rule.execute(patent_data)
+        except Exception as e:
+            return self._skip_result(rule, e)
+    
+    @staticmethod
+    def _skip_result(rule: ExaminationRule, error: Exception) -> RuleExecutionResult:
+        """规则执行失败"""
+        return RuleExecutionResult(
+            rule_name=rule.name,
+            rule_type=rule.rule_type,
+            result=RuleResult.SKIP,
+            confidence=0.0,
+            message=f"规则执行失败: {str(error)}",
+            details={"error": str(error)},
+            execution_time=0.0
+        )
+    
+    def compile(self) -> Callable[[Dict[str, Any]], List[RuleExecutionResult]]:
+        """
+        为当前启用的规则生成一个合并的执行函数
+        
+        生成的函数依次直接调用各规则的 execute 方法（出错时返回SKIP结果），
+        省去每次执行时的规则筛选和逐条分派。规则列表或启用状态变化后需重新编译，
+        execute_rules 会自动完成。
+        
+        Returns:
+            Callable: 接收专利数据、返回按优先级排列的规则执行结果列表的函数
+        """
+        generation = (self._generation, ExaminationRule.active_generation)
+        rules = self.filter_rules()
+        
+        namespace: Dict[str, Any] = {}
+        lines = ["def execute_compiled_rules(patent_data):"]
+        for i, rule in enumerate(rules):
+            namespace[f"execute_{i}"] = rule.execute
+            namespace[f"rule_{i}"] = rule
+            lines += [
+                "    try:",
+                f"        r{i} = execute_{i}(patent_data)",
+                "    except Exception as e:",
+                f"        r{i} = skip_result(rule_{i}, e)"
+            ]
+        lines.append(f"    return [{', '.join(f'r{i}' for i in range(len(rules)))}]")
+        namespace["skip_result"] = self._skip_result
+        
+        exec(compile("\n".join(lines), "<rules>", "exec"), namespace)
+        compiled = namespace["execute_compiled_rules"]
+        self._compiled = (generation, compiled)
+        return compiled
+    
+    def _get_compiled(self) -> Callable[[Dict[str, Any]], List[RuleExecutionResult]]:
+        compiled = self._compiled
+        if compiled is not None and compiled[0] == (self._generation, ExaminationRule.active_generation):
+            return compiled[1]
+        return self.compile()
     
     def execute_rules(self, patent_data: Dict[str, Any], rule_types: Optional[List[RuleType]] = None) -> List[RuleExecutionResult]:
         """
         执行规则
         
+        执行全部规则时使用 compile() 生成的合并函数；按类型筛选时各规则相互独立，
+        多条规则在线程池中并行执行。结果按规则优先级排列。
+        
         Args:
             patent_data: 专利数据
             rule_types: 要执行的规则类型，None表示执行所有规则
@@ -309,32 +529,52 @@ class RuleEngine:
         Returns:
             List[RuleExecutionResult]: 规则执行结果列表
         """
-        results = []
-        
-        for rule in self.rules:
-            if not rule.is_active:
-                continue
-                
-            if rule_types and rule.rule_type not in rule_types:
-                continue
+        if not rule_types:
+            return self._get_compiled()(patent_data)
+        
+        rules = self.filter_rules(rule_types)
+        if len(rules) < 2:
+            return [self.execute_rule(patent_data, rule) for rule in rules]
+        
+        executor = self._get_executor()
+        return list(executor.map(lambda rule: self.execute_rule(patent_data, rule), rules))
+    
+    def execute_rules_batch(
+        self,
+        patent_list: List[Dict[str, Any]],
+        rule_types: Optional[List[RuleType]] = None
+    ) -> List[List[RuleExecutionResult]]:
+        """
+        批量执行规则
+        
+        每条规则一次处理全部文档（如保护客体规则先完成所有文档的关键词扫描），
+        各规则在线程池中并行执行。
+        
+        Args:
+            patent_list: 专利数据列表
+            rule_types: 要执行的规则类型，None表示执行所有规则
             
-            try:
-                result = rule.execute(patent_data)
-                results.append(result)
-            except Exception as e:
-                # 规则执行失败
-                error_result = RuleExecutionResult(
-                    rule_name=rule.name,
-                    rule_type=rule.rule_type,
-                    result=RuleResult.SKIP,
-                    confidence=0.0,
-                    message=f"规则执行失败: {str(e)}",
-                    details={"error": str(e)},
-                    execution_time=0.0
-                )
-                results.append(error_result)
+        Returns:
+            List[List[RuleExecutionResult]]: 与 patent_list 一一对应的规则执行结果列表
+        """
+        rules = self.filter_rules(rule_types)
+        if not patent_list or not rules:
+            return [[] for _ in patent_list]
         
-        return results
+        if len(rules) < 2:
+            results_by_rule = [self._execute_rule_batch(patent_list, rule) for rule in rules]
+        else:
+            executor = self._get_executor()
+            results_by_rule = list(executor.map(lambda rule: self._execute_rule_batch(patent_list, rule), rules))
+        
+        return [list(results) for results in zip(*results_by_rule)]
+    
+    def _execute_rule_batch(self, patent_list: List[Dict[str, Any]], rule: ExaminationRule) -> List[RuleExecutionResult]:
+        """批量执行单条规则，出错时逐个文档重新执行，只有出错的文档返回SKIP结果"""
+        try:
+            return rule.execute_batch(patent_list)
+        except Exception:
+            return [self.execute_rule(patent_data, rule) for patent_data in patent_list]
     
     def get_summary(self, results: List[RuleExecutionResult]) -> Dict[str, Any]:
         """获取执行结果摘要"""
@@ -349,25 +589,27 @@ class RuleEngine:
             "recommendations": []
         }
         
+        # 一次遍历完成计数、问题收集和置信度累加
+        counts = [0] * len(RuleResult)
+        critical_issues = summary["critical_issues"]
+        recommendations = summary["recommendations"]
         confidence_sum = 0.0
         confidence_count = 0
         
         for result in results:
-            if result.result == RuleResult.PASS:
-                summary["passed"] += 1
-            elif result.result == RuleResult.FAIL:
-                summary["failed"] += 1
-                summary["critical_issues"].append(result.message)
+            counts[result.result] += 1
+            if result.result == RuleResult.FAIL:
+                critical_issues.append(result.message)
             elif result.result == RuleResult.WARNING:
-                summary["warnings"] += 1
-                summary["recommendations"].append(result.message)
-            elif result.result == RuleResult.SKIP:
-                summary["skipped"] += 1
+                recommendations.append(result.message)
             
+            # 跳过的规则置信度为0，不参与平均
             if result.confidence > 0:
                 confidence_sum += result.confidence
                 confidence_count += 1
         
+        summary["passed"], summary["failed"], summary["warnings"], summary["skipped"] = counts
+        
         # 计算平均置信度
         if confidence_count > 0:
             summary["overall_confidence"] = confidence_sum / confidence_count
@@ -0,0 +1,3 @@
+"""
+工具模块
+"""
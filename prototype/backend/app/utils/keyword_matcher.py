@@ -0,0 +1,61 @@
+"""
+关键词匹配工具 - 单次扫描文本查找多个关键词
+
+安装了 pyahocorasick 时使用 Aho-Corasick 自动机，一次线性扫描找出全部关键词；
+未安装时退回逐个关键词的子串查找，结果相同。
+"""
+from typing import Any, Dict, Iterable, Mapping, Union
+
+try:
+    import ahocorasick
+except ImportError:  # 可选依赖
+    ahocorasick = None
+
+class KeywordMatcher:
+    """
+    多关键词匹配器
+
+    构建后只读，可在线程间共享。
+    """
+
+    def __init__(self, keywords: Union[Mapping[str, Any], Iterable[str]]):
+        """
+        Args:
+            keywords: 关键词列表，或关键词到附加值（如正/负向标记）的映射
+        """
+        if isinstance(keywords, Mapping):
+            self._values: Dict[str, Any] = dict(keywords)
+        else:
+            self._values = {keyword: keyword for keyword in keywords}
+
+        self._automaton = None
+        if ahocorasick is not None and self._values:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self._values:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+
+    @property
+    def keywords(self) -> Iterable[str]:
+        return self._values.keys()
+
+    def find(self, text: str) -> Dict[str, Any]:
+        """
+        查找文本中出现的关键词
+
+        Args:
+            text: 待扫描文本
+
+        Returns:
+            Dict[str, Any]: 出现的关键词及其附加值，按关键词定义顺序排列
+        """
+        if not text:
+            return {}
+
+        if self._automaton is not None:
+            hits = {keyword for _, keyword in self._automaton.iter(text)}
+        else:
+            # 直接在 str 上查找：专利文本以中文为主，先编码为UTF-8再按字节查找反而更慢
+            hits = {keyword for keyword in self._values if keyword in text}
+
+        return {keyword: value for keyword, value in self._values.items() if keyword in hits}
@@ -0,0 +1,114 @@
+"""
+提示词裁剪工具 - 按token预算截断各段文本
+
+安装了 transformers 且已通过 load_tokenizer 加载模型分词器时按实际token计数；
+否则按字符估算（中文每字1个token，ASCII每4个字符1个token）。
+分词器只从本地目录或Hugging Face缓存加载，不访问网络；加载较慢，
+应用在启动时于线程池中调用 load_tokenizer，请求中不会触发加载。
+"""
+import os
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+# 默认的提示词正文token预算
+DEFAULT_TOKEN_BUDGET = 2000
+
+# 计数使用的分词器（本地目录或已缓存的模型名），设为空字符串时始终按字符估算
+TOKENIZER_NAME = os.getenv("PROMPT_TOKENIZER", "Qwen/Qwen2.5-7B")
+
+@lru_cache(maxsize=1)
+def load_tokenizer() -> Optional[Any]:
+    """加载分词器（阻塞，只加载一次），不可用时返回None"""
+    if not TOKENIZER_NAME:
+        return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(TOKENIZER_NAME, use_fast=True, local_files_only=True)
+    except Exception as e:
+        # 未安装 transformers 或本地没有分词器文件
+        print(f"加载分词器失败，按字符估算token数: {e}")
+        return None
+
+def get_tokenizer() -> Optional[Any]:
+    """返回已加载的分词器；尚未调用 load_tokenizer 时返回None，不在调用方线程中加载"""
+    if load_tokenizer.cache_info().currsize:
+        return load_tokenizer()
+    return None
+
+def estimate_tokens(text: str) -> float:
+    """
+    估算文本的token数
+
+    有分词器时返回实际token数；否则中文等非ASCII字符按每字1个token计算，
+    ASCII字符按每4个字符1个token计算。
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (len(text) - ascii_chars) + ascii_chars / 4
+
+def truncate_to_tokens(text: str, budget: float) -> str:
+    """
+    将文本截断到指定的token预算内
+
+    Args:
+        text: 原始文本
+        budget: token预算
+
+    Returns:
+        str: 截断后的文本
+    """
+    if budget <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        token_ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(token_ids) <= budget:
+            return text
+        return tokenizer.decode(token_ids[:int(budget)])
+    # 每个字符最多1个token，长度不超过预算时无需逐字计算
+    if len(text) <= budget:
+        return text
+
+    used = 0.0
+    for index, ch in enumerate(text):
+        used += 0.25 if ch < "\x80" else 1
+        if used > budget:
+            return text[:index]
+    return text
+
+def trim_sections(sections: List[Tuple[str, str]], budget: float = DEFAULT_TOKEN_BUDGET) -> List[Tuple[str, str]]:
+    """
+    在总预算内裁剪多个段落
+
+    短段落保留全文，剩余预算在较长段落之间平均分配。
+
+    Args:
+        sections: (标签, 文本) 列表，按原顺序输出
+        budget: 总token预算
+
+    Returns:
+        List[Tuple[str, str]]: 裁剪后的 (标签, 文本) 列表
+    """
+    costs = [estimate_tokens(text) for _, text in sections]
+    allocations = [0.0] * len(sections)
+
+    remaining = budget
+    pending = sorted(range(len(sections)), key=costs.__getitem__)
+    while pending:
+        share = remaining / len(pending)
+        index = pending[0]
+        if costs[index] > share:
+            # 剩余段落都超过平均份额，按平均份额截断
+            for index in pending:
+                allocations[index] = share
+            break
+        allocations[index] = costs[index]
+        remaining -= costs[index]
+        pending.pop(0)
+
+    return [
+        (label, text if allocations[i] >= costs[i] else truncate_to_tokens(text, allocations[i]))
+        for i, (label, text) in enumerate(sections)
+    ]
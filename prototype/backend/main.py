@@ -1,11 +1,21 @@
 """
 专利审查辅助程序后端主入口
 """
+import asyncio
+import logging
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api import router
 from app.core.database import init_db
+from app.services.ai_batcher import ai_batcher
+from app.services.ai_service import ai_service
+from app.services.document_parser import document_parser
+from app.services.rule_engine import rule_engine
+from app.utils.prompt_trim import load_tokenizer
+
+logger = logging.getLogger(__name__)
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -26,11 +36,46 @@ app.add_middleware(
 # 注册路由
 app.include_router(router, prefix="/api/v1")
 
+async def init_database():
+    """在线程池中初始化数据库，完成后设置 db_ready；失败时记录原因"""
+    try:
+        await asyncio.to_thread(init_db)
+    except Exception as e:
+        logger.exception("数据库初始化失败")
+        app.state.db_init_error = str(e)
+        return
+    app.state.db_ready.set()
+    print("数据库初始化完成")
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库"""
-    init_db()
-    print("数据库初始化完成")
+    # 数据库初始化不阻塞事件循环，完成前 /health 和依赖数据库的路由返回503
+    app.state.db_ready = asyncio.Event()
+    app.state.db_init_error = None
+    app.state.db_init_task = asyncio.create_task(init_database())
+    # 同时预编译规则引擎
+    app.state.rule_warmup_task = asyncio.create_task(asyncio.to_thread(rule_engine.compile))
+    # 后台加载提示词分词器，加载完成前按字符估算token数
+    app.state.tokenizer_task = asyncio.create_task(asyncio.to_thread(load_tokenizer))
+    app.state.ollama = ai_service.open_async_client()
+    ai_batcher.start()
+    # 后台健康检查，状态路由只读取 app.state.health
+    app.state.health = ai_service.health
+    app.state.health_task = asyncio.create_task(ai_service.health_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止后台任务"""
+    app.state.health_task.cancel()
+    app.state.db_init_task.cancel()
+    app.state.rule_warmup_task.cancel()
+    app.state.tokenizer_task.cancel()
+    await ai_batcher.stop()
+    await ai_service.aclose()
+    ai_service.close()
+    document_parser.shutdown()
+    rule_engine.shutdown()
 
 @app.get("/")
 async def root():
@@ -39,7 +84,21 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口，数据库初始化完成前或失败时返回503"""
+    if app.state.db_init_error is not None:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "service": "patent-examination-backend",
+                "error": f"数据库初始化失败: {app.state.db_init_error}"
+            }
+        )
+    if not app.state.db_ready.is_set():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "service": "patent-examination-backend"}
+        )
     return {"status": "healthy", "service": "patent-examination-backend"}
 
 if __name__ == "__main__":
@@ -58,8 +58,8 @@ export const apiService = {
     });
   },
 
-  getDocuments: (skip: number = 0, limit: number = 20) => {
-    return api.get(`/documents/list?skip=${skip}&limit=${limit}`);
+  getDocuments: (skip: number = 0, limit: number = 20, includeTotal: boolean = true) => {
+    return api.get(`/documents/list?skip=${skip}&limit=${limit}&include_total=${includeTotal}`);
   },
 
   getDocumentDetail: (id: number) => {
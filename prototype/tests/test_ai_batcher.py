@@ -0,0 +1,60 @@
+"""
+AI请求批处理测试
+"""
+import asyncio
+import pytest
+from backend.app.services.ai_batcher import AIBatcher, QueueFullError
+
+class TestAIBatcher:
+
+    def test_queue_full(self):
+        """测试排队和执行中的请求超过上限时拒绝新请求"""
+        async def scenario():
+            batcher = AIBatcher(batch_window=0.001, max_queue=4, num_parallel=1)
+            batcher.start()
+            release = asyncio.Event()
+
+            async def blocked():
+                await release.wait()
+                return "done"
+
+            tasks = [asyncio.create_task(batcher.submit(blocked)) for _ in range(4)]
+            await asyncio.sleep(0.05)
+
+            # 超时保护：未拒绝时请求会一直等待
+            with pytest.raises(QueueFullError):
+                await asyncio.wait_for(batcher.submit(blocked), 1.0)
+
+            release.set()
+            results = await asyncio.gather(*tasks)
+            await batcher.stop()
+            return results
+
+        assert asyncio.run(scenario()) == ["done"] * 4
+
+    def test_concurrency_limit(self):
+        """测试同时执行的调用数不超过 num_parallel"""
+        async def scenario():
+            batcher = AIBatcher(batch_window=0.001, max_queue=64, num_parallel=2)
+            batcher.start()
+            running = 0
+            peak = 0
+
+            async def call(i):
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                return i
+
+            results = await asyncio.gather(*(batcher.submit(call, i) for i in range(10)))
+            await batcher.stop()
+            return results, peak
+
+        results, peak = asyncio.run(scenario())
+        assert results == list(range(10))
+        assert peak == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
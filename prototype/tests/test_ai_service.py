@@ -0,0 +1,217 @@
+"""
+AI服务测试
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from backend.app.services.ai_service import AIResponse, AIService, Provider, SemanticCache, _ChatStreamCollector
+
+def make_response(content: str) -> AIResponse:
+    return AIResponse(
+        success=True,
+        content=content,
+        confidence=0.8,
+        processing_time=1.0,
+        model_used="test-model"
+    )
+
+class TestSemanticCache:
+
+    def setup_method(self):
+        """测试前准备"""
+        self.cache = SemanticCache(maxsize=4, threshold=0.97)
+
+    def test_similar_embedding_hit(self):
+        """测试近似向量命中"""
+        self.cache.set("model|comprehensive", [1.0, 0.0, 0.0], make_response("A"))
+
+        response = self.cache.get("model|comprehensive", [0.99, 0.05, 0.0])
+        assert response is not None
+        assert response.content == "A"
+
+    def test_dissimilar_embedding_miss(self):
+        """测试不相似向量不命中"""
+        self.cache.set("model|comprehensive", [1.0, 0.0, 0.0], make_response("A"))
+
+        assert self.cache.get("model|comprehensive", [0.0, 1.0, 0.0]) is None
+
+    def test_namespace_isolation(self):
+        """测试不同分析类型互不命中"""
+        self.cache.set("model|comprehensive", [1.0, 0.0, 0.0], make_response("A"))
+
+        assert self.cache.get("model|novelty", [1.0, 0.0, 0.0]) is None
+
+    def test_ring_eviction(self):
+        """测试超过容量后覆盖最早的条目"""
+        for i in range(5):
+            vector = [0.0] * 5
+            vector[i] = 1.0
+            self.cache.set("ns", vector, make_response(str(i)))
+
+        assert self.cache.get("ns", [1.0, 0.0, 0.0, 0.0, 0.0]) is None
+        assert self.cache.get("ns", [0.0, 0.0, 0.0, 0.0, 1.0]).content == "4"
+
+class TestEmbeddingFailure:
+
+    def test_skip_embedding_after_failure(self):
+        """测试嵌入失败后暂停请求嵌入接口"""
+        service = AIService()
+        calls = []
+
+        async def failing_embed(texts):
+            calls.append(texts)
+            raise ConnectionError("embedding model not found")
+
+        service.aembed_texts = failing_embed
+        try:
+            assert asyncio.run(service._embed_text("一种螺栓")) is None
+            assert asyncio.run(service._embed_text("一种螺母")) is None
+            assert len(calls) == 1
+        finally:
+            service.close()
+
+class TestNoveltyRisk:
+
+    def test_reference_embeddings_cached(self):
+        """测试参考向量按缓存键只嵌入一次，之后只嵌入待评估文本"""
+        service = AIService()
+        calls = []
+        vectors = {"一种螺栓": [1.0, 0.0], "一种螺母": [0.0, 1.0], "一种垫圈": [0.6, 0.8]}
+
+        async def fake_embed(texts):
+            calls.append(list(texts))
+            return [vectors[text] for text in texts]
+
+        service.aembed_texts = fake_embed
+        try:
+            async def scenario():
+                first = await service.assess_novelty_risk(
+                    "一种螺栓", ["一种螺母", "一种垫圈"], reference_keys=["a", "b"]
+                )
+                second = await service.assess_novelty_risk(
+                    "一种螺栓", ["一种螺母", "一种垫圈"], reference_keys=["a", "b"]
+                )
+                return first, second
+
+            first, second = asyncio.run(scenario())
+            assert calls == [["一种螺栓", "一种螺母", "一种垫圈"], ["一种螺栓"]]
+            assert second == first
+            assert first["neighbors"][0] == {"index": 1, "similarity": pytest.approx(0.6)}
+        finally:
+            service.close()
+
+class TestProviderChain:
+
+    def setup_method(self):
+        """测试前准备"""
+        self.service = AIService()
+        self.calls = []
+
+    def provider(self, name: str, status_code: int = 200) -> Provider:
+        async def call(prompt: str) -> AIResponse:
+            self.calls.append(name)
+            if status_code == 200:
+                return make_response(name)
+            return self.service._error_response(name, f"HTTP {status_code}: error", status_code)
+        return Provider(name=name, call=call, timeout=1.0)
+
+    def test_fallback_to_next_provider(self):
+        """测试服务端错误时切换到下一个模型并暂停失败的模型"""
+        chain = [self.provider("primary", 503), self.provider("backup")]
+
+        response, attempts = asyncio.run(self.service._run_provider_chain(chain, "prompt"))
+        assert response.content == "backup"
+        assert response.attempts == [("primary", "HTTP 503: error")]
+
+        asyncio.run(self.service._run_provider_chain(chain, "prompt"))
+        assert self.calls == ["primary", "backup", "backup"]
+
+    def test_client_error_not_skipped(self):
+        """测试非限流的客户端错误不暂停模型"""
+        chain = [self.provider("primary", 404), self.provider("backup", 429)]
+
+        response, attempts = asyncio.run(self.service._run_provider_chain(chain, "prompt"))
+        assert response is None
+        assert [name for name, _ in attempts] == ["primary", "backup"]
+
+        _, attempts = asyncio.run(self.service._run_provider_chain(chain, "prompt"))
+        assert self.calls == ["primary", "backup", "primary"]
+        assert attempts[1] == ("backup", "暂不可用，已跳过")
+
+    def test_stalled_primary_times_out(self):
+        """测试主模型无响应时在其超时后切换到备用模型"""
+        release = threading.Event()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if payload["model"] == "primary":
+                    release.wait(5)
+                    return
+                body = json.dumps({"message": {"content": "{}"}, "done": True}).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            self.service.ollama_base_url = f"http://127.0.0.1:{server.server_port}"
+            self.service.default_model = "primary"
+            self.service.backup_model = "backup"
+            self.service.primary_timeout = 0.3
+
+            async def scenario():
+                try:
+                    return await self.service._run_provider_chain(
+                        self.service._analysis_providers(), [{"role": "user", "content": "prompt"}]
+                    )
+                finally:
+                    await self.service.aclose()
+
+            start = time.monotonic()
+            response, attempts = asyncio.run(scenario())
+
+            assert response.model_used == "backup"
+            assert attempts == [("primary", "请求超时")]
+            assert time.monotonic() - start < 2
+        finally:
+            release.set()
+            server.shutdown()
+            server.server_close()
+            self.service.close()
+
+class TestChatStreamCollector:
+
+    @staticmethod
+    def line(content: str, done: bool = False) -> str:
+        return json.dumps({"message": {"role": "assistant", "content": content}, "done": done})
+
+    def test_stop_after_json_object(self):
+        """测试顶层JSON对象闭合后停止读取，忽略字符串中的括号"""
+        collector = _ChatStreamCollector()
+        pieces = ['```json\n{"a": "}\\"{', '", "b": {"c": 1}', '}  以上', '是说明']
+
+        finished = [collector.feed_line(self.line(piece)) for piece in pieces[:3]]
+        assert finished == [False, False, True]
+        assert collector.content == '```json\n{"a": "}\\"{", "b": {"c": 1}}'
+        assert json.loads(collector.content[8:]) == {"a": '}"{', "b": {"c": 1}}
+
+    def test_plain_text_until_done(self):
+        """测试非JSON输出读到结束"""
+        collector = _ChatStreamCollector()
+
+        assert collector.feed_line(self.line("没有")) is False
+        assert collector.feed_line("") is False
+        assert collector.feed_line(self.line("JSON", done=True)) is True
+        assert collector.content == "没有JSON"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,64 @@
+"""
+数据库就绪检查测试
+"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from backend.app.core import database
+from backend.app.core.database import wait_db_ready
+
+def make_request(**state) -> SimpleNamespace:
+    return SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(**state)))
+
+class TestWaitDbReady:
+
+    def test_waits_for_init(self):
+        """测试初始化完成前到达的请求等待初始化完成"""
+        async def scenario():
+            ready = asyncio.Event()
+
+            async def init():
+                await asyncio.sleep(0.05)
+                ready.set()
+
+            task = asyncio.create_task(init())
+            await wait_db_ready(make_request(db_ready=ready, db_init_task=task))
+            return ready.is_set()
+
+        assert asyncio.run(scenario()) is True
+
+    def test_init_failure(self):
+        """测试初始化失败时立即返回503并给出原因"""
+        async def scenario():
+            async def init():
+                pass
+
+            task = asyncio.create_task(init())
+            await wait_db_ready(make_request(
+                db_ready=asyncio.Event(), db_init_task=task, db_init_error="disk I/O error"
+            ))
+
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(scenario())
+        assert excinfo.value.status_code == 503
+        assert "disk I/O error" in excinfo.value.detail
+
+    def test_init_timeout(self, monkeypatch):
+        """测试初始化超时后返回503，初始化任务继续运行"""
+        monkeypatch.setattr(database, "DB_READY_TIMEOUT", 0.05)
+
+        async def scenario():
+            task = asyncio.create_task(asyncio.sleep(1))
+            try:
+                with pytest.raises(HTTPException) as excinfo:
+                    await wait_db_ready(make_request(db_ready=asyncio.Event(), db_init_task=task))
+                assert excinfo.value.status_code == 503
+                assert not task.done()
+            finally:
+                task.cancel()
+
+        asyncio.run(scenario())
+
+if __name__ == "__main__":
+    pytest.main([__file__])
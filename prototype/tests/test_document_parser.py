@@ -72,6 +72,79 @@ class TestDocumentParser:
             # 清理临时文件
             os.unlink(temp_file)
     
+    def test_parse_gbk_text_document(self):
+        """测试解析GBK编码的文本文档"""
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+            f.write("发明名称：一种螺栓\n申请人：测试公司\n".encode('gbk'))
+            temp_file = f.name
+
+        try:
+            patent_doc, metadata = self.parser.parse_document(temp_file)
+
+            assert patent_doc.title == "一种螺栓"
+            assert patent_doc.applicant == "测试公司"
+            assert metadata["encoding"] == "gbk"
+        finally:
+            os.unlink(temp_file)
+
+    @pytest.mark.parametrize("encoding", ["utf-8", "gbk"])
+    @pytest.mark.parametrize("newline", ["\r\n", "\r"])
+    def test_parse_text_newlines(self, encoding, newline):
+        """测试CRLF和CR换行的文本文档统一为LF"""
+        lines = ["发明名称：一种螺栓", "申请人：测试公司", "", "技术领域", "本实用新型涉及紧固件，", "特别是螺栓。", "", "背景技术", "现有螺栓容易松动。"]
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+            f.write(newline.join(lines).encode(encoding))
+            temp_file = f.name
+
+        try:
+            patent_doc, _ = self.parser.parse_document(temp_file)
+
+            assert patent_doc.title == "一种螺栓"
+            assert patent_doc.applicant == "测试公司"
+            assert patent_doc.technical_field == "本实用新型涉及紧固件，\n特别是螺栓。"
+        finally:
+            os.unlink(temp_file)
+
+    def test_extract_overlapping_labels(self):
+        """测试相互重叠的字段标签"""
+        text = (
+            "实用新型名称：一种螺母\n申请人：测试公司\n发明人：李四\n\n"
+            "所属技术领域\n本实用新型涉及紧固件。\n\n"
+            "背景技术领域的现有螺母容易松动。\n\n"
+            "摘 要\n一种螺母。"
+        )
+
+        patent_doc = self.parser._extract_patent_info(text)
+
+        assert patent_doc.title == "一种螺母"
+        assert patent_doc.applicant == "测试公司"
+        assert patent_doc.inventor == "李四"
+        assert patent_doc.technical_field == "本实用新型涉及紧固件。"
+        assert patent_doc.background_art == "领域的现有螺母容易松动。"
+        assert patent_doc.abstract == "一种螺母。"
+
+    def test_claims_round_trip(self):
+        """测试权利要求以 (序号, 内容) 保存并可还原"""
+        text = "权利要求书\n1. 一种螺母，包括螺纹孔。\n2. 根据权利要求1所述的螺母，其特征在于：外形为六边形。\n"
+
+        patent_doc = self.parser._extract_patent_info(text)
+
+        assert patent_doc.claims[0] == ("1", "一种螺母，包括螺纹孔。")
+        assert patent_doc.formatted_claims[1].startswith("2. 根据权利要求1")
+
+        restored = PatentDocument.from_patent_data({"claims": patent_doc.formatted_claims})
+        assert restored.claims == patent_doc.claims
+
+    def test_claims_keep_number_text(self):
+        """测试权利要求序号保持原文（前导零、全角数字）"""
+        text = "权利要求书\n01. 一种螺母。\n０２. 根据权利要求1所述的螺母。\n"
+
+        patent_doc = self.parser._extract_patent_info(text)
+
+        assert patent_doc.formatted_claims == ["01. 一种螺母。", "０２. 根据权利要求1所述的螺母。"]
+        restored = PatentDocument.from_patent_data({"claims": patent_doc.formatted_claims})
+        assert restored.formatted_claims == patent_doc.formatted_claims
+
     def test_validate_document_complete(self):
         """测试完整文档验证"""
         patent_doc = PatentDocument(
@@ -84,8 +157,8 @@ class TestDocumentParser:
         
         validation_result = self.parser.validate_document(patent_doc)
         
-        assert len(validation_result["errors"]) == 0
-        assert len(validation_result["warnings"]) == 0
+        assert len(validation_result.errors) == 0
+        assert len(validation_result.warnings) == 0
     
     def test_validate_document_missing_required(self):
         """测试缺少必需字段的文档验证"""
@@ -96,9 +169,9 @@ class TestDocumentParser:
         
         validation_result = self.parser.validate_document(patent_doc)
         
-        assert "缺少发明名称" in validation_result["errors"]
-        assert "缺少申请人信息" in validation_result["errors"]
-        assert "缺少权利要求书" in validation_result["errors"]
+        assert "缺少发明名称" in validation_result.errors
+        assert "缺少申请人信息" in validation_result.errors
+        assert "缺少权利要求书" in validation_result.errors
     
     def test_validate_document_warnings(self):
         """测试文档验证警告"""
@@ -111,10 +184,57 @@ class TestDocumentParser:
         
         validation_result = self.parser.validate_document(patent_doc)
         
-        assert len(validation_result["errors"]) == 0
-        assert "发明名称过长" in str(validation_result["warnings"])
-        assert "申请号格式可能不正确" in str(validation_result["warnings"])
+        assert len(validation_result.errors) == 0
+        assert "发明名称过长" in str(validation_result.warnings)
+        assert "申请号格式可能不正确" in str(validation_result.warnings)
     
+    @pytest.mark.parametrize("application_date, valid", [
+        ("2021年12月15日", True),
+        ("2021年1月5日", True),
+        ("2021.12.15", True),
+        ("2021-1-5", True),
+        ("2021年13月15日", False),
+        ("2021年12月0日", False),
+        ("2021年12月", False),
+        ("21年12月15日", False),
+        ("2021/12/15", False)
+    ])
+    def test_validate_document_date(self, application_date, valid):
+        """测试申请日期格式检查"""
+        patent_doc = PatentDocument(
+            title="测试发明",
+            applicant="测试公司",
+            claims=["权利要求1"],
+            abstract="测试摘要",
+            application_date=application_date
+        )
+
+        warnings = self.parser.validate_document(patent_doc).warnings
+
+        assert ("申请日期格式可能不正确" not in warnings) == valid
+
+    def test_parse_document_cache(self):
+        """测试解析结果缓存"""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
+            f.write("发明名称：一种螺栓\n")
+            temp_file = f.name
+
+        try:
+            first, _ = self.parser.parse_document(temp_file)
+            second, _ = self.parser.parse_document(temp_file)
+            assert second is first
+
+            # 文件内容变化后重新解析
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write("发明名称：一种新型螺母结构\n")
+            os.utime(temp_file, ns=(0, os.stat(temp_file).st_mtime_ns + 1))
+
+            third, _ = self.parser.parse_document(temp_file)
+            assert third is not first
+            assert third.title == "一种新型螺母结构"
+        finally:
+            os.unlink(temp_file)
+
     def test_parse_nonexistent_file(self):
         """测试解析不存在的文件"""
         with pytest.raises(FileNotFoundError):
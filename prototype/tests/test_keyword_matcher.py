@@ -0,0 +1,41 @@
+"""
+关键词匹配工具测试
+"""
+import pytest
+from backend.app.utils import keyword_matcher
+from backend.app.utils.keyword_matcher import KeywordMatcher
+
+@pytest.fixture(params=["automaton", "substring"])
+def backend(request, monkeypatch):
+    """分别测试Aho-Corasick和子串查找两种实现"""
+    if request.param == "automaton":
+        pytest.importorskip("ahocorasick")
+    else:
+        monkeypatch.setattr(keyword_matcher, "ahocorasick", None)
+    return request.param
+
+class TestKeywordMatcher:
+
+    def test_find_in_definition_order(self, backend):
+        """测试结果按关键词定义顺序返回"""
+        matcher = KeywordMatcher(["技术效果", "发明", "权利要求"])
+
+        found = matcher.find("本发明的权利要求具有技术效果")
+        assert list(found) == ["技术效果", "发明", "权利要求"]
+
+    def test_overlapping_keywords(self, backend):
+        """测试相互包含的关键词都能找到"""
+        matcher = KeywordMatcher(["发明", "实用新型", "新型"])
+
+        assert list(matcher.find("一种实用新型")) == ["实用新型", "新型"]
+
+    def test_mapping_values(self, backend):
+        """测试关键词附加值"""
+        matcher = KeywordMatcher({"结构": 1, "方法": -1})
+
+        assert matcher.find("一种结构及其方法") == {"结构": 1, "方法": -1}
+        assert matcher.find("无关文本") == {}
+        assert matcher.find("") == {}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
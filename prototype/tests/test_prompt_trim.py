@@ -0,0 +1,90 @@
+"""
+提示词裁剪测试
+"""
+import pytest
+from backend.app.utils import prompt_trim
+from backend.app.utils.prompt_trim import estimate_tokens, truncate_to_tokens, trim_sections
+
+class CharPairTokenizer:
+    """测试用分词器：每两个字符一个token"""
+
+    def encode(self, text, add_special_tokens=False):
+        return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+    def decode(self, token_ids):
+        return "".join(token_ids)
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    monkeypatch.setattr(prompt_trim, "get_tokenizer", lambda: CharPairTokenizer())
+
+@pytest.fixture(autouse=True)
+def heuristic(request, monkeypatch):
+    """默认按字符估算，不加载模型分词器"""
+    if "tokenizer" not in request.fixturenames:
+        monkeypatch.setattr(prompt_trim, "get_tokenizer", lambda: None)
+
+class TestPromptTrim:
+
+    def test_estimate_tokens(self):
+        """测试token估算"""
+        assert estimate_tokens("螺栓结构") == 4
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("") == 0
+
+    def test_truncate_to_tokens(self):
+        """测试按预算截断"""
+        assert truncate_to_tokens("一种螺栓", 10) == "一种螺栓"
+        assert truncate_to_tokens("一种新型螺栓结构", 4) == "一种新型"
+        assert truncate_to_tokens("一种螺栓", 0) == ""
+
+    def test_trim_sections_keeps_short_sections(self):
+        """测试短段落保留全文，长段落分得剩余预算"""
+        sections = [
+            ("发明名称", "一种螺栓"),
+            ("发明内容", "内" * 100),
+            ("权利要求", "权" * 100)
+        ]
+
+        trimmed = trim_sections(sections, budget=44)
+
+        assert trimmed[0] == ("发明名称", "一种螺栓")
+        assert len(trimmed[1][1]) == 20
+        assert len(trimmed[2][1]) == 20
+
+    def test_trim_sections_within_budget(self):
+        """测试未超预算时不裁剪"""
+        sections = [("发明名称", "一种螺栓"), ("技术领域", "紧固件")]
+
+        assert trim_sections(sections, budget=100) == sections
+
+    def test_load_local_tokenizer(self, tmp_path, monkeypatch):
+        """测试从本地目录加载分词器后按实际token计数"""
+        pytest.importorskip("transformers")
+        from tokenizers import Tokenizer, models, pre_tokenizers
+        from transformers import PreTrainedTokenizerFast
+
+        vocab = {"[UNK]": 0, "一种": 1, "螺栓": 2}
+        backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+        backend.pre_tokenizer = pre_tokenizers.Whitespace()
+        PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]").save_pretrained(tmp_path)
+
+        monkeypatch.undo()
+        monkeypatch.setattr(prompt_trim, "TOKENIZER_NAME", str(tmp_path))
+        prompt_trim.load_tokenizer.cache_clear()
+        try:
+            assert prompt_trim.get_tokenizer() is None
+            assert prompt_trim.load_tokenizer() is not None
+            assert prompt_trim.get_tokenizer() is not None
+            assert estimate_tokens("一种 螺栓") == 2
+        finally:
+            prompt_trim.load_tokenizer.cache_clear()
+
+    def test_model_tokenizer(self, tokenizer):
+        """测试有分词器时按实际token计数和截断"""
+        assert estimate_tokens("一种新型螺栓") == 3
+        assert truncate_to_tokens("一种新型螺栓结构", 2) == "一种新型"
+        assert truncate_to_tokens("一种螺栓", 2) == "一种螺栓"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
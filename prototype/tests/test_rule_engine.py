@@ -17,6 +17,10 @@ class TestRuleEngine:
         """测试前准备"""
         self.rule_engine = RuleEngine()
     
+    def teardown_method(self):
+        """测试后关闭规则线程池"""
+        self.rule_engine.shutdown()
+    
     def test_rule_engine_initialization(self):
         """测试规则引擎初始化"""
         assert len(self.rule_engine.rules) > 0
@@ -116,7 +120,22 @@ class TestRuleEngine:
         assert result.result == RuleResult.FAIL
         assert "不属于实用新型保护客体" in result.message
         assert len(result.details["negative_matches"]) > 0
-    
+
+    def test_subject_matter_rule_scan_cache(self):
+        """测试重复提交相同内容时复用关键词扫描结果"""
+        rule = SubjectMatterRule()
+        patent_data = {"title": "一种螺栓结构", "claims": ["一种制造方法"]}
+
+        first = rule.execute(patent_data)
+        second = rule.execute(dict(patent_data))
+
+        assert rule._scan.cache_info().hits == 1
+        assert second.details == first.details
+
+        # 结果中的列表不与缓存共享
+        first.details["positive_matches"].append("其他")
+        assert rule.execute(patent_data).details["positive_matches"] == second.details["positive_matches"]
+
     def test_claims_format_rule_pass(self):
         """测试权利要求书格式检查 - 通过"""
         rule = ClaimsFormatRule()
@@ -206,6 +225,87 @@ class TestRuleEngine:
         for result in results:
             assert result.rule_type == RuleType.FORMAL
     
+    def test_rule_engine_parallel_keeps_priority_order(self):
+        """测试并行执行时结果按优先级排列，单条规则出错不影响其他规则"""
+        class FailingRule(DocumentCompletenessRule):
+            def execute(self, patent_data):
+                raise ValueError("boom")
+        
+        failing_rule = FailingRule()
+        failing_rule.name = "出错规则"
+        failing_rule.priority = 0
+        self.rule_engine.add_rule(failing_rule)
+        
+        # 按类型筛选时经线程池执行（不筛选时使用编译后的合并函数）
+        results = self.rule_engine.execute_rules(
+            {"title": "一种螺栓结构"},
+            rule_types=[RuleType.FORMAL, RuleType.SUBJECT_MATTER]
+        )
+        
+        assert self.rule_engine._executor is not None
+        assert [r.rule_name for r in results] == [rule.name for rule in self.rule_engine.rules]
+        assert results[0].result == RuleResult.SKIP
+        assert "boom" in results[0].message
+    
+    def test_rule_engine_compiled_rules(self):
+        """测试编译后的执行函数与逐条执行一致，规则停用后重新编译"""
+        patent_data = {"title": "一种螺栓结构", "claims": ["1. 一种螺栓，其特征在于：螺栓头为六边形。"]}
+
+        compiled = self.rule_engine.compile()
+        expected = [self.rule_engine.execute_rule(patent_data, rule) for rule in self.rule_engine.rules]
+        assert [(r.rule_name, r.result, r.message) for r in compiled(patent_data)] == \
+            [(r.rule_name, r.result, r.message) for r in expected]
+
+        self.rule_engine.rules[0].is_active = False
+        results = self.rule_engine.execute_rules(patent_data)
+
+        assert [r.rule_name for r in results] == [rule.name for rule in self.rule_engine.rules[1:]]
+
+    def test_rule_engine_compiled_matches_executor(self):
+        """测试编译路径与线程池逐条执行路径结果一致"""
+        patent_data = {
+            "title": "一种螺栓结构",
+            "applicant": "测试公司",
+            "claims": ["1. 一种螺栓，其特征在于：螺栓头为六边形。", "一种制造方法"]
+        }
+
+        compiled = self.rule_engine.execute_rules(patent_data)
+        executed = self.rule_engine.execute_rules(patent_data, rule_types=list(RuleType))
+
+        assert [(r.rule_name, r.result, r.confidence, r.message, r.details) for r in compiled] == \
+            [(r.rule_name, r.result, r.confidence, r.message, r.details) for r in executed]
+
+    def test_rule_engine_add_rule_invalidates_compiled(self):
+        """测试编译后添加规则时重新编译"""
+        compiled = self.rule_engine.compile()
+        assert self.rule_engine._get_compiled() is compiled
+
+        new_rule = ClaimsFormatRule()
+        new_rule.name = "新增规则"
+        new_rule.priority = 0
+        self.rule_engine.add_rule(new_rule)
+
+        assert self.rule_engine._get_compiled() is not compiled
+        results = self.rule_engine.execute_rules({"title": "一种螺栓结构"})
+        assert [r.rule_name for r in results] == [rule.name for rule in self.rule_engine.rules]
+        assert results[0].rule_name == "新增规则"
+
+    def test_rule_engine_execute_rules_batch(self):
+        """测试批量执行与逐个执行结果一致"""
+        patent_list = [
+            {"title": "一种螺栓结构", "claims": ["1. 一种螺栓，包括螺栓头，其特征在于：螺栓头为六边形。"]},
+            {"title": "一种制造方法", "claims": ["一种制造步骤，包括以下工艺流程"]},
+            {}
+        ]
+        
+        batch_results = self.rule_engine.execute_rules_batch(patent_list)
+        
+        assert len(batch_results) == len(patent_list)
+        for patent_data, results in zip(patent_list, batch_results):
+            expected = self.rule_engine.execute_rules(patent_data)
+            assert [(r.rule_name, r.result, r.message, r.details) for r in results] == \
+                [(r.rule_name, r.result, r.message, r.details) for r in expected]
+    
     def test_rule_engine_get_summary(self):
         """测试获取执行结果摘要"""
         patent_data = {